@@ -2,21 +2,32 @@ from __future__ import annotations
 
 # pyright: reportUnusedFunction=false
 
+import base64
+import functools
+import json
+import math
 import os
 from datetime import date
-from typing import Any, Dict, List, Tuple, cast
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, cast
 
-from flask import Flask, jsonify, request, Response
+from flask import (
+    Flask, current_app, jsonify, make_response, request, Response, stream_with_context
+)
+from psycopg2 import IntegrityError
 from werkzeug.exceptions import HTTPException
 
-from database_adapter import DatabaseAdapter
-from meal_manager import MealManager
+from catalog_cache import CatalogCache
+from database_adapter import NUTRIENTS, DatabaseAdapter, REQUIRED_SCHEMA_VERSION
+import instrumentation
+from meal_manager import MAX_PLAN_DAYS, MealManager
+from planner import NutritionPlanner
+from versions import DataVersions
 from datatypes import (
     User, UserCreate, UserUpdate,
     Ingredient, IngredientCreate, IngredientUpdate,
     Menu, MenuCreate, MenuUpdate,
     Meal, MealCreate, MealUpdate,
-    InventoryUpsert,
+    InventoryUpsert, InventoryChange,
     Meal_Ingredient, Menu_Ingredient, MenuIngredientsPayload, MealIngredientsPayload,
     ResponseMessage
 )
@@ -45,20 +56,194 @@ def json_body() -> Dict[str, Any]:
         raise APIError(400, "invalid_json", "Body must be a JSON object")
     return cast(Dict[str, Any], data)
 
+def stream_json_array(items: Iterable[Any], chunk_size: int = 64 * 1024) -> Response:
+    """
+    JSON array response encoded while `items` is consumed and sent in chunks
+    of roughly `chunk_size` characters; neither the rows nor the body are
+    ever held in full. The request context (and its DB connection) stays
+    open until the last chunk is written.
+    """
+    def generate() -> Iterator[str]:
+        encode = current_app.json.dumps
+        buffer: List[str] = ["["]
+        size = 1
+        first = True
+        for item in items:
+            encoded = encode(item) if first else "," + encode(item)
+            first = False
+            buffer.append(encoded)
+            size += len(encoded)
+            if size >= chunk_size:
+                yield "".join(buffer)
+                buffer, size = [], 0
+        buffer.append("]\n")
+        yield "".join(buffer)
+
+    return Response(stream_with_context(generate()), mimetype="application/json")
+
+def encode_cursor(kind: str, key: Any) -> str:
+    """Opaque keyset cursor: url-safe base64 of [kind, last key]."""
+    raw = json.dumps([kind, key], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(kind: str, token: str, key_type: type) -> Any:
+    try:
+        found_kind, key = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except Exception:
+        raise APIError(422, "invalid_cursor", "Malformed pagination cursor")
+    if found_kind != kind or type(key) is not key_type:
+        raise APIError(422, "invalid_cursor", f"Cursor does not belong to /{kind}")
+    return key
+
+def check_schema(db: DatabaseAdapter) -> None:
+    """Refuse to start against a database that misses required migrations."""
+    try:
+        version = db.schema_version()
+    except RuntimeError as e:
+        # DB not reachable yet (e.g. still booting); /healthz will report it
+        print(f"Schema check skipped: {e}")
+        return
+    if version < REQUIRED_SCHEMA_VERSION:
+        raise RuntimeError(
+            f"Database schema is at version {version}, but version {REQUIRED_SCHEMA_VERSION} "
+            "is required; apply the migrations in infra/init"
+        )
+
 # ---------- app ----------
 
 def create_app() -> Flask:
     app = Flask(__name__)
 
+    # Ingredient/menu catalog cache; CATALOG_CACHE_SIZE=0 disables it
+    cache_size = int(os.getenv("CATALOG_CACHE_SIZE", "2048"))
+    cache = (
+        CatalogCache(max_entries=cache_size, ttl=float(os.getenv("CATALOG_CACHE_TTL", "300")))
+        if cache_size > 0
+        else None
+    )
+
     db = DatabaseAdapter(
         host=os.getenv("PGHOST", "127.0.0.1"),
         username=os.getenv("PGUSER", "postgres"),
         password=os.getenv("PGPASSWORD", "postgres"),
         database=os.getenv("PGDATABASE", "sagdu"),
         port=int(os.getenv("PGPORT", "5432")),
+        min_connections=int(os.getenv("PGPOOL_MIN", "1")),
+        max_connections=int(os.getenv("PGPOOL_MAX", "10")),
+        checkout_timeout=float(os.getenv("PGPOOL_TIMEOUT", "10")),
+        cache=cache,
+        # PGPREPARE=0 behind poolers that don't keep server sessions
+        prepare_statements=os.getenv("PGPREPARE", "1") == "1",
     )
 
-    meal_manager = MealManager(db)
+    if os.getenv("SCHEMA_CHECK", "1") == "1":
+        check_schema(db)
+
+    planner = None
+    if os.getenv("PLANNER", "nutrition") == "nutrition":
+        planner = NutritionPlanner(
+            db, time_budget=float(os.getenv("PLANNER_TIME_BUDGET_MS", "200")) / 1000
+        )
+    meal_manager = MealManager(db, planner)
+    # Lets other entry points (asgi.py) reuse the adapter and its cache
+    app.extensions["db"] = db
+
+    # ETags from per-scope change counters; ETAGS_ENABLED=0 turns them off
+    # Other workers' writes reach this process's catalog cache through the listener
+    versions = (
+        DataVersions(db, on_change=db.invalidate_catalog)
+        if os.getenv("ETAGS_ENABLED", "1") == "1"
+        else None
+    )
+    app.extensions["versions"] = versions
+
+    def bump(*scopes: str) -> None:
+        if versions is not None:
+            versions.bump(*scopes)
+
+    def conditional(scopes: Callable[..., Sequence[str]]):
+        """
+        Serve the view with a strong ETag over the versions of `scopes(**view_args)`
+        and answer a matching If-None-Match with 304 before the view (and the
+        database) is touched. The query string and today's date are part of
+        the tag, as default date ranges move at midnight.
+        """
+        def decorator(view: Callable[..., Any]) -> Callable[..., Any]:
+            @functools.wraps(view)
+            def wrapper(**kwargs: Any) -> Any:
+                tag: Optional[str] = None
+                if versions is not None:
+                    tag = versions.etag(
+                        *scopes(**kwargs),
+                        extra=(request.full_path, date.today().isoformat()),
+                    )
+                if tag is None:
+                    return view(**kwargs)
+                if request.if_none_match.contains(tag):
+                    not_modified = Response(status=304)
+                    not_modified.set_etag(tag)
+                    return not_modified
+                response = make_response(view(**kwargs))
+                if response.status_code == 200:
+                    response.set_etag(tag)
+                return response
+            return wrapper
+        return decorator
+
+    # Lists above MAX_LIST_LIMIT rows (or with ?stream=1) are streamed from a
+    # server-side cursor instead of being buffered and cached.
+    max_list_limit = int(os.getenv("MAX_LIST_LIMIT", "1000"))
+    stream_batch_size = int(os.getenv("STREAM_BATCH_SIZE", "500"))
+
+    def list_args(default_limit: int) -> Tuple[Optional[int], int, bool]:
+        """(limit, offset, streamed); a streamed request without `limit` returns all rows."""
+        streamed = request.args.get("stream") == "1"
+        raw_limit = request.args.get("limit")
+        try:
+            limit = int(raw_limit) if raw_limit is not None else (None if streamed else default_limit)
+            offset = int(request.args.get("offset", "0"))
+        except ValueError:
+            raise APIError(422, "invalid_request", "limit and offset must be integers")
+        if (limit is not None and limit < 0) or offset < 0:
+            raise APIError(422, "invalid_request", "limit and offset must be >= 0")
+        return limit, offset, streamed or limit is None or limit > max_list_limit
+
+    def keyset_args(kind: str, key_type: type, default_limit: int) -> Tuple[Any, int]:
+        """(last key or None for the first page, limit) of an ?after= request."""
+        after = request.args.get("after", "")
+        try:
+            limit = int(request.args.get("limit", str(default_limit)))
+        except ValueError:
+            raise APIError(422, "invalid_request", "limit must be an integer")
+        # A cursor page never needs streaming: the client asks for the next one
+        limit = min(max(limit, 1), max_list_limit)
+        return (decode_cursor(kind, after, key_type) if after else None), limit
+
+    def keyset_page(kind: str, rows: List[Any], limit: int, key: Callable[[Any], Any]) -> Response:
+        """`rows` holds up to limit + 1 items; the extra one only signals another page."""
+        next_cursor = encode_cursor(kind, key(rows[limit - 1])) if len(rows) > limit else None
+        return jsonify({"data": rows[:limit], "next_cursor": next_cursor})
+
+    def meal_owner(meal_id: int) -> Optional[int]:
+        meal = db.get_meal(meal_id) if versions is not None else None
+        return meal["user_id"] if meal is not None else None
+
+    slow_query_ms = os.getenv("SLOW_QUERY_MS")
+    instrumentation.install(
+        app,
+        db,
+        metrics_enabled=os.getenv("METRICS_ENABLED", "0") == "1",
+        slow_query_ms=float(slow_query_ms) if slow_query_ms else None,
+    )
+
+    # At most one pooled connection per request, returned (and reset) on teardown
+    @app.before_request
+    def open_connection_scope() -> None:
+        db.open_scope()
+
+    @app.teardown_request
+    def release_connection(_exc: BaseException | None) -> None:
+        db.release()
 
     # Errors
     @app.errorhandler(APIError)
@@ -81,13 +266,24 @@ def create_app() -> Flask:
             print(f"/healthz error: {e}")
             return jsonify({"ok": False}), 500
 
+    @app.get("/cache/stats")
+    def cache_stats_endpoint() -> Tuple[Response, int]:
+        return jsonify({"catalog": db.cache_stats()}), 200
+
     # ---------- Users ----------
 
     @app.get("/users")
     def list_users_endpoint() -> Tuple[Response, int]:
-        limit = int(request.args.get("limit", "50"))
-        offset = int(request.args.get("offset", "0"))
-        users = db.list_users(limit=limit, offset=offset)
+        if "after" in request.args:
+            after_id, limit = keyset_args("users", int, 50)
+            users = db.list_users_after(after_id, limit + 1)
+            return keyset_page("users", users, limit, lambda u: u["id"]), 200
+        limit, offset, streamed = list_args(50)
+        if streamed:
+            return stream_json_array(
+                db.stream_users(limit=limit, offset=offset, batch_size=stream_batch_size)
+            ), 200
+        users = db.list_users(limit=cast(int, limit), offset=offset)
         return jsonify(users), 200
 
     @app.post("/users")
@@ -118,26 +314,59 @@ def create_app() -> Flask:
         ok = db.delete_user(user_id)
         if not ok:
             raise APIError(404, "not_found", "User not found")
+        bump(f"user:{user_id}")
         return '', 204
     
     @app.get("/users/<int:user_id>/create_meals")
     def create_meals_for_user_endpoint(user_id: int) -> Tuple[Response, int]:
-        res = meal_manager.create_meals(user_id)
+        try:
+            days = int(request.args.get("days", "7"))
+        except ValueError:
+            raise APIError(422, "invalid_request", "days must be an integer")
+        days = min(max(days, 1), MAX_PLAN_DAYS)
+        # Optional daily targets per person, e.g. ?calories=1800&protein=90
+        targets: Dict[str, float] = {}
+        for nutrient in NUTRIENTS:
+            raw = request.args.get(nutrient)
+            if raw is None:
+                continue
+            try:
+                targets[nutrient] = float(raw)
+            except ValueError:
+                raise APIError(422, "invalid_request", f"{nutrient} must be a number")
+            if not math.isfinite(targets[nutrient]) or targets[nutrient] < 0:
+                raise APIError(422, "invalid_request", f"{nutrient} must be >= 0")
+        res = meal_manager.create_meals(user_id, days, targets, request.args.get("mode"))
+        if res["status"] == "error":
+            raise APIError(422, "invalid_request", res.get("error") or "Could not plan meals")
         if res["status"] != "success":
             raise APIError(404, "not_found", "User not found")
+        # Nothing is saved here; PUT /users/<id>/meals bumps when the plan is stored
         return jsonify(res["data"]), 200
     
     @app.put("/users/<int:user_id>/meals")
     def save_meals_for_user_endpoint(user_id: int) -> Tuple[Response, int]:
-        meals = cast(List[Meal], json_body().get("meals", []))
-        response: ResponseMessage = meal_manager.safe_meals(meals)
+        body = json_body()
+        meals = cast(List[Meal], body.get("meals", []))
+        copy_ingredients = bool(body.get("copy_menu_ingredients", True))
+        response: ResponseMessage = meal_manager.safe_meals(user_id, meals, copy_ingredients)
         if response["status"] != "success":
             raise APIError(400, "bad_request", response.get("error") or "Could not save meals")
+        bump(f"user:{user_id}")
         return jsonify(response["data"]), 200
     
     @app.get("/users/<int:user_id>/shopping_list")
+    @conditional(lambda user_id: (f"user:{user_id}", "ingredients"))
     def get_shopping_list_endpoint(user_id: int) -> Tuple[Response, int]:
-        res = meal_manager.get_shopping_list(user_id)
+        date_from = request.args.get("from")
+        date_to = request.args.get("to")
+        res = meal_manager.get_shopping_list(
+            user_id,
+            parse_iso_date(date_from) if date_from else None,
+            parse_iso_date(date_to) if date_to else None,
+        )
+        if res["status"] == "error":
+            raise APIError(422, "invalid_range", res.get("error") or "Invalid date range")
         if res["status"] != "success":
             raise APIError(404, "not_found", "User not found")
         return jsonify(res["data"]), 200
@@ -146,6 +375,39 @@ def create_app() -> Flask:
     def get_user_inventory_endpoint(user_id: int) -> Tuple[Response, int]:
         return jsonify(db.get_user_inventory(user_id)), 200
 
+    @app.patch("/users/<int:user_id>/inventory")
+    def update_inventory_endpoint(user_id: int) -> Tuple[Response, int]:
+        items = json_body().get("items")
+        if not isinstance(items, list):
+            raise APIError(422, "invalid_request", "items must be a list")
+        changes: List[InventoryChange] = []
+        for item in items:
+            # bool is an int subclass; JSON true/false are not numbers here
+            if (
+                not isinstance(item, dict)
+                or not isinstance(item.get("ingredient_id"), int)
+                or isinstance(item.get("ingredient_id"), bool)
+                or ("quantity" in item) == ("delta" in item)
+                or not isinstance(item.get("quantity", item.get("delta")), (int, float))
+                or isinstance(item.get("quantity", item.get("delta")), bool)
+            ):
+                raise APIError(
+                    422, "invalid_request",
+                    "Each item needs an integer ingredient_id and a numeric quantity or delta",
+                )
+            changes.append(cast(InventoryChange, item))
+        try:
+            inventory = db.update_user_inventory(user_id, changes)
+        except ValueError as e:
+            raise APIError(422, "invalid_request", str(e))
+        except IntegrityError as e:
+            # Foreign keys of user_ingredient: the user or an ingredient is unknown
+            if "user_id" in (e.diag.constraint_name or ""):
+                raise APIError(404, "not_found", "User not found")
+            raise APIError(422, "invalid_request", "Unknown ingredient_id")
+        bump(f"user:{user_id}")
+        return jsonify(inventory), 200
+
     @app.put("/users/<int:user_id>/inventory/<int:ingredient_id>")
     def upsert_inventory_item_endpoint(user_id: int, ingredient_id: int) -> Tuple[Response | str, int]:
         body = cast(InventoryUpsert, json_body())
@@ -153,15 +415,24 @@ def create_app() -> Flask:
         ok = db.upsert_user_ingredient(user_id, ingredient_id, qty)
         if not ok:
             raise APIError(400, "bad_request", "Unable to upsert inventory item")
+        bump(f"user:{user_id}")
         return (jsonify({"ingredient_id": ingredient_id, "quantity": qty}), 200) if qty > 0 else ('', 204)
 
     # ---------- Ingredients ----------
 
     @app.get("/ingredients")
+    @conditional(lambda: ("ingredients",))
     def list_ingredients_endpoint() -> Tuple[Response, int]:
-        limit = int(request.args.get("limit", "200"))
-        offset = int(request.args.get("offset", "0"))
-        return jsonify(db.list_ingredients(limit=limit, offset=offset)), 200
+        if "after" in request.args:
+            after_name, limit = keyset_args("ingredients", str, 200)
+            ingredients = db.list_ingredients_after(after_name, limit + 1)
+            return keyset_page("ingredients", ingredients, limit, lambda i: i["name"]), 200
+        limit, offset, streamed = list_args(200)
+        if streamed:
+            return stream_json_array(
+                db.stream_ingredients(limit=limit, offset=offset, batch_size=stream_batch_size)
+            ), 200
+        return jsonify(db.list_ingredients(limit=cast(int, limit), offset=offset)), 200
 
     @app.post("/ingredients")
     def create_ingredient_endpoint() -> Tuple[Response, int, Dict[str, str]]:
@@ -169,6 +440,7 @@ def create_app() -> Flask:
         ok = db.create_ingredient(cast(Ingredient, body))
         if not ok:
             raise APIError(409, "conflict_or_invalid", "Could not create ingredient")
+        bump("ingredients")
         return jsonify({"id": body["id"]}), 201, {"Location": f"/ingredients/{body['id']}"}
 
     @app.get("/ingredients/<int:ingredient_id>")
@@ -184,6 +456,7 @@ def create_app() -> Flask:
         ok = db.update_ingredient(ingredient_id, **body)
         if not ok:
             raise APIError(404, "not_found", "Ingredient not found or no changes")
+        bump("ingredients")
         return '', 204
 
     @app.delete("/ingredients/<int:ingredient_id>")
@@ -191,14 +464,23 @@ def create_app() -> Flask:
         ok = db.delete_ingredient(ingredient_id)
         if not ok:
             raise APIError(404, "not_found", "Ingredient not found")
+        bump("ingredients")
         return '', 204
 
     # ---------- Menus ----------
 
     @app.get("/menus")
+    @conditional(lambda: ("menus",))
     def list_menus_endpoint() -> Tuple[Response, int]:
-        limit = int(request.args.get("limit", "100"))
-        offset = int(request.args.get("offset", "0"))
+        if "after" in request.args:
+            after_name, limit = keyset_args("menus", str, 100)
+            menus = db.list_menus_after(after_name, limit + 1)
+            return keyset_page("menus", menus, limit, lambda m: m["name"]), 200
+        limit, offset, streamed = list_args(100)
+        if streamed:
+            return stream_json_array(
+                db.stream_menus(limit=limit, offset=offset, batch_size=stream_batch_size)
+            ), 200
         return jsonify(db.list_menus(limit=limit, offset=offset)), 200
 
     @app.post("/menus")
@@ -207,9 +489,11 @@ def create_app() -> Flask:
         new_id = db.create_menu(cast(Menu, body))
         if new_id is None:
             raise APIError(409, "conflict_or_invalid", "Could not create menu")
+        bump("menus")
         return jsonify({"id": new_id}), 201, {"Location": f"/menus/{new_id}"}
 
     @app.get("/menus/<int:menu_id>")
+    @conditional(lambda menu_id: ("menus",))
     def get_menu_endpoint(menu_id: int) -> Tuple[Response, int]:
         m = db.get_menu(menu_id)
         if m is None:
@@ -222,6 +506,7 @@ def create_app() -> Flask:
         ok = db.update_menu(menu_id, **body)
         if not ok:
             raise APIError(404, "not_found", "Menu not found or no changes")
+        bump("menus")
         return '', 204
 
     @app.delete("/menus/<int:menu_id>")
@@ -229,6 +514,7 @@ def create_app() -> Flask:
         ok = db.delete_menu(menu_id)
         if not ok:
             raise APIError(404, "not_found", "Menu not found")
+        bump("menus")
         return '', 204
 
     @app.get("/menus/<int:menu_id>/ingredients")
@@ -242,6 +528,8 @@ def create_app() -> Flask:
         ok = db.set_menu_ingredients(menu_id, items)
         if not ok:
             raise APIError(400, "bad_request", "Could not set menu ingredients")
+        # Diet flags and nutrients changed; other workers drop their copies
+        bump("menus")
         return '', 204
 
     # ---------- Meals (single-day only) ----------
@@ -259,10 +547,12 @@ def create_app() -> Flask:
                 "description": body["description"],
                 "people": body["people"],
                 "menu_id": body.get("menu_id"),
-            })
+            }),
+            copy_menu_ingredients=bool(body.get("copy_menu_ingredients", True)),
         )
         if new_id is None:
             raise APIError(409, "conflict_or_invalid", "Could not create meal")
+        bump(f"user:{body['user_id']}")
         return jsonify({"id": new_id}), 201, {"Location": f"/meals/{new_id}"}
 
     @app.get("/meals/<int:meal_id>")
@@ -277,25 +567,52 @@ def create_app() -> Flask:
         body = cast(MealUpdate, json_body())
         if "date" in body and body["date"]:
             body = cast(MealUpdate, {**body, "date": parse_iso_date(body["date"])})
+        owner = meal_owner(meal_id)
         ok = db.update_meal(meal_id, **body)
         if not ok:
             raise APIError(404, "not_found", "Meal not found or no changes")
+        # A meal can move to another user
+        bump(*{f"user:{u}" for u in (owner, body.get("user_id")) if u is not None})
         return '', 204
 
     @app.delete("/meals/<int:meal_id>")
     def delete_meal_endpoint(meal_id: int) -> Tuple[str, int]:
+        owner = meal_owner(meal_id)
         ok = db.delete_meal(meal_id)
         if not ok:
             raise APIError(404, "not_found", "Meal not found")
+        if owner is not None:
+            bump(f"user:{owner}")
         return '', 204
 
+    # "menus" too: deleting a menu nulls meal.menu_id without touching the user
     @app.get("/users/<int:user_id>/meals")
+    @conditional(lambda user_id: (f"user:{user_id}", "menus", "ingredients"))
     def list_meals_for_user_on_date_endpoint(user_id: int) -> Tuple[Response, int]:
         meals = meal_manager.get_meals_of_user(user_id)
         if meals["status"] != "success":
             raise APIError(404, "not_found", "User not found")
         return jsonify(meals["data"]), 200
 
+    @app.post("/meals/<int:meal_id>/cook")
+    def cook_meal_endpoint(meal_id: int) -> Tuple[Response, int]:
+        meal = db.get_meal(meal_id)
+        if meal is None:
+            raise APIError(404, "not_found", "Meal not found")
+        result = db.cook_meal(meal_id)
+        if not result["cooked"]:
+            raise APIError(409, "already_cooked", "Meal was already cooked")
+        bump(f"user:{meal['user_id']}")
+        return jsonify(result), 200
+
+    @app.post("/users/<int:user_id>/cook")
+    def cook_meals_for_user_endpoint(user_id: int) -> Tuple[Response, int]:
+        meal_date = request.args.get("date")
+        result = db.cook_meals(user_id, parse_iso_date(meal_date) if meal_date else date.today())
+        if result["cooked"]:
+            bump(f"user:{user_id}")
+        return jsonify(result), 200
+
     @app.get("/meals/<int:meal_id>/ingredients")
     def get_meal_ingredients_endpoint(meal_id: int) -> Tuple[Response, int]:
         return jsonify(db.get_meal_ingredients(meal_id)), 200
@@ -304,9 +621,12 @@ def create_app() -> Flask:
     def set_meal_ingredients_endpoint(meal_id: int) -> Tuple[str, int]:
         body = cast(MealIngredientsPayload, json_body())
         items: List[Meal_Ingredient] = [{"meal_id": meal_id, **it} for it in body.get("items", [])]
+        owner = meal_owner(meal_id)
         ok = db.set_meal_ingredients(meal_id, items)
         if not ok:
             raise APIError(400, "bad_request", "Could not set meal ingredients")
+        if owner is not None:
+            bump(f"user:{owner}")
         return '', 204
 
     return app
@@ -315,4 +635,9 @@ def create_app() -> Flask:
 app = create_app()
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=int(os.getenv("PORT", "4000")), debug=True)
+    # Development server only; production runs `gunicorn -c gunicorn.conf.py app:app`
+    app.run(
+        host="0.0.0.0",
+        port=int(os.getenv("PORT", "4000")),
+        debug=os.getenv("FLASK_DEBUG", "1") == "1",
+    )
@@ -0,0 +1,274 @@
+"""
+ASGI entry point for the API:
+
+    uvicorn asgi:app --host 0.0.0.0 --port 4000
+
+The read routes that dominate traffic are served natively with
+AsyncDatabaseAdapter, so a single worker keeps many requests in flight without
+a thread each. Every other route defined in `create_app()` (all writes, the
+meal planner) is passed to the Flask app through asgiref's WSGI bridge and
+runs in a thread. Both sides share one adapter configuration and catalog
+cache, so writes on the Flask side invalidate what the async side serves.
+The routes the Flask app serves with ETags get the same tags here, from the
+same DataVersions, and answer a matching If-None-Match with 304.
+"""
+
+from __future__ import annotations
+
+import os
+from datetime import date, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple, cast
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+from werkzeug.exceptions import MethodNotAllowed, NotFound
+from werkzeug.http import parse_etags, quote_etag
+from werkzeug.routing import Map, Rule
+
+from app import APIError, app as flask_app
+from async_database_adapter import AsyncDatabaseAdapter
+from database_adapter import DatabaseAdapter
+from versions import DataVersions
+
+Scope = Dict[str, Any]
+Receive = Callable[[], Awaitable[Dict[str, Any]]]
+Send = Callable[[Dict[str, Any]], Awaitable[None]]
+Query = Dict[str, List[str]]
+Handler = Callable[..., Awaitable[Tuple[Any, int]]]
+
+sync_db = cast(DatabaseAdapter, flask_app.extensions["db"])
+versions = cast(Optional[DataVersions], flask_app.extensions["versions"])
+db = AsyncDatabaseAdapter(
+    sync_db,
+    min_connections=int(os.getenv("ASYNC_POOL_MIN", "1")),
+    max_connections=int(os.getenv("ASYNC_POOL_MAX", "20")),
+    checkout_timeout=float(os.getenv("PGPOOL_TIMEOUT", "10")),
+)
+MAX_LIST_LIMIT = int(os.getenv("MAX_LIST_LIMIT", "1000"))
+
+
+def _arg(query: Query, name: str, default: str) -> str:
+    values = query.get(name)
+    return values[0] if values else default
+
+
+def _flask_only(query: Query) -> bool:
+    """Keyset pages and streamed lists are only implemented by the Flask app."""
+    if "after" in query or _arg(query, "stream", "0") == "1":
+        return True
+    limit = _arg(query, "limit", "")
+    return limit.isdigit() and int(limit) > MAX_LIST_LIMIT
+
+
+def _page_args(query: Query, default_limit: int) -> Tuple[int, int]:
+    """(limit, offset), validated like the Flask app's list_args."""
+    try:
+        limit = int(_arg(query, "limit", str(default_limit)))
+        offset = int(_arg(query, "offset", "0"))
+    except ValueError:
+        raise APIError(422, "invalid_request", "limit and offset must be integers")
+    if limit < 0 or offset < 0:
+        raise APIError(422, "invalid_request", "limit and offset must be >= 0")
+    return limit, offset
+
+
+def _date_arg(query: Query, name: str) -> Optional[date]:
+    value = _arg(query, name, "")
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise APIError(422, "invalid_date", f"Invalid ISO date: {value!r}")
+
+
+# ---------- native async routes ----------
+
+async def health(query: Query) -> Tuple[Any, int]:
+    try:
+        await db.list_users(limit=1, offset=0)
+        return {"ok": True}, 200
+    except Exception as e:
+        print(f"/healthz error: {e}")
+        return {"ok": False}, 500
+
+
+async def get_user(query: Query, user_id: int) -> Tuple[Any, int]:
+    u = await db.get_user(user_id)
+    if u is None:
+        raise APIError(404, "not_found", "User not found")
+    return u, 200
+
+
+async def get_user_inventory(query: Query, user_id: int) -> Tuple[Any, int]:
+    return await db.get_user_inventory(user_id), 200
+
+
+async def list_meals_for_user(query: Query, user_id: int) -> Tuple[Any, int]:
+    date_from = date.today()
+    return await db.list_meals_by_user(user_id, date_from, date_from + timedelta(days=7)), 200
+
+
+async def get_shopping_list(query: Query, user_id: int) -> Tuple[Any, int]:
+    date_from = _date_arg(query, "from") or date.today()
+    date_to = _date_arg(query, "to") or date_from + timedelta(days=7)
+    if date_to < date_from:
+        raise APIError(422, "invalid_range", "date_to is before date_from")
+    return await db.get_shopping_list(user_id, date_from, date_to), 200
+
+
+async def list_ingredients(query: Query) -> Tuple[Any, int]:
+    limit, offset = _page_args(query, 200)
+    return await db.list_ingredients(limit=limit, offset=offset), 200
+
+
+async def get_ingredient(query: Query, ingredient_id: int) -> Tuple[Any, int]:
+    ing = await db.get_ingredient(ingredient_id)
+    if ing is None:
+        raise APIError(404, "not_found", "Ingredient not found")
+    return ing, 200
+
+
+async def list_menus(query: Query) -> Tuple[Any, int]:
+    limit, offset = _page_args(query, 100)
+    return await db.list_menus(limit=limit, offset=offset), 200
+
+
+async def get_menu(query: Query, menu_id: int) -> Tuple[Any, int]:
+    m = await db.get_menu(menu_id)
+    if m is None:
+        raise APIError(404, "not_found", "Menu not found")
+    return m, 200
+
+
+async def get_menu_ingredients(query: Query, menu_id: int) -> Tuple[Any, int]:
+    return await db.get_menu_ingredients(menu_id), 200
+
+
+async def get_meal(query: Query, meal_id: int) -> Tuple[Any, int]:
+    m = await db.get_meal(meal_id)
+    if m is None:
+        raise APIError(404, "not_found", "Meal not found")
+    return m, 200
+
+
+async def get_meal_ingredients(query: Query, meal_id: int) -> Tuple[Any, int]:
+    return await db.get_meal_ingredients(meal_id), 200
+
+
+# Version scopes of the ETagged routes, as in the Flask app's @conditional
+etag_scopes: Dict[Handler, Callable[..., Sequence[str]]] = {
+    list_meals_for_user: lambda user_id: (f"user:{user_id}", "menus", "ingredients"),
+    get_shopping_list: lambda user_id: (f"user:{user_id}", "ingredients"),
+    list_ingredients: lambda: ("ingredients",),
+    list_menus: lambda: ("menus",),
+    get_menu: lambda menu_id: ("menus",),
+}
+
+
+def _etag(scope: Scope, handler: Handler, args: Dict[str, Any]) -> Optional[str]:
+    """Same tag as the Flask app: versions plus request.full_path and today's date."""
+    scopes = etag_scopes.get(handler)
+    if versions is None or scopes is None:
+        return None
+    full_path = f"{scope['path']}?{scope.get('query_string', b'').decode()}"
+    return versions.etag(*scopes(**args), extra=(full_path, date.today().isoformat()))
+
+
+def _header(scope: Scope, name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers", []):
+        if key.lower() == name:
+            return cast(bytes, value).decode("latin-1")
+    return None
+
+
+# Same rule syntax as Flask; GET only, anything else goes to the Flask app
+routes = Map([
+    Rule("/healthz", endpoint=health),
+    Rule("/users/<int:user_id>", endpoint=get_user),
+    Rule("/users/<int:user_id>/inventory", endpoint=get_user_inventory),
+    Rule("/users/<int:user_id>/meals", endpoint=list_meals_for_user),
+    Rule("/users/<int:user_id>/shopping_list", endpoint=get_shopping_list),
+    Rule("/ingredients", endpoint=list_ingredients),
+    Rule("/ingredients/<int:ingredient_id>", endpoint=get_ingredient),
+    Rule("/menus", endpoint=list_menus),
+    Rule("/menus/<int:menu_id>", endpoint=get_menu),
+    Rule("/menus/<int:menu_id>/ingredients", endpoint=get_menu_ingredients),
+    Rule("/meals/<int:meal_id>", endpoint=get_meal),
+    Rule("/meals/<int:meal_id>/ingredients", endpoint=get_meal_ingredients),
+], strict_slashes=False)
+
+
+# ---------- ASGI app ----------
+
+wsgi_fallback = WsgiToAsgi(flask_app)
+
+
+async def _respond(send: Send, status: int, payload: Any, etag: Optional[str] = None) -> None:
+    # Flask's JSON provider, so dates etc. serialize exactly like jsonify()
+    body = flask_app.json.dumps(payload).encode() + b"\n"
+    headers = [
+        (b"content-type", b"application/json"),
+        (b"content-length", str(len(body)).encode()),
+    ]
+    if etag is not None and status == 200:
+        headers.append((b"etag", quote_etag(etag).encode()))
+    await send({"type": "http.response.start", "status": status, "headers": headers})
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _not_modified(send: Send, etag: str) -> None:
+    await send({
+        "type": "http.response.start",
+        "status": 304,
+        "headers": [(b"etag", quote_etag(etag).encode())],
+    })
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def _lifespan(receive: Receive, send: Send) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            try:
+                await db.connect()
+            except Exception as e:
+                # DB may still be booting; the pool keeps retrying in the background
+                print(f"Async pool startup error: {e}")
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await db.disconnect()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope: Scope, receive: Receive, send: Send) -> None:
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] != "http" or scope["method"] != "GET":
+        await wsgi_fallback(scope, receive, send)
+        return
+    try:
+        handler, args = routes.bind("").match(scope["path"], method="GET")
+    except (NotFound, MethodNotAllowed):
+        await wsgi_fallback(scope, receive, send)
+        return
+
+    query = parse_qs(scope.get("query_string", b"").decode(), keep_blank_values=True)
+    if _flask_only(query):
+        await wsgi_fallback(scope, receive, send)
+        return
+    # Answered before the handler, so a 304 costs no query
+    etag = _etag(scope, handler, args)
+    if etag is not None and parse_etags(_header(scope, b"if-none-match")).contains(etag):
+        await _not_modified(send, etag)
+        return
+    try:
+        payload, status = await handler(query, **args)
+    except APIError as err:
+        payload, status = {"error": {"code": err.code, "message": err.message}}, err.status
+    except Exception as e:
+        print(f"Unexpected error: {e}")
+        payload, status = {"error": {"code": "internal_error", "message": "Something went wrong"}}, 500
+    await _respond(send, status, payload, etag)
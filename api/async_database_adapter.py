@@ -0,0 +1,454 @@
+from __future__ import annotations
+
+import asyncio
+import itertools
+from datetime import date
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple, cast
+
+from psycopg.conninfo import make_conninfo
+from psycopg_pool import AsyncConnectionPool
+
+from catalog_cache import CatalogCache
+from database_adapter import (
+    DatabaseAdapter,
+    Row,
+    Rows,
+    SQL_GET_INGREDIENT,
+    SQL_GET_INGREDIENTS,
+    SQL_GET_MEAL,
+    SQL_GET_MENU,
+    SQL_GET_USER,
+    SQL_LIST_INGREDIENTS,
+    SQL_LIST_INGREDIENTS_AFTER,
+    SQL_LIST_MENUS,
+    SQL_LIST_MENUS_AFTER,
+    SQL_LIST_USERS,
+    SQL_LIST_USERS_AFTER,
+    SQL_MEAL_INGREDIENTS,
+    SQL_MENU_INGREDIENTS,
+    SQL_REQUIRED_INGREDIENTS,
+    SQL_SHOPPING_LIST,
+    SQL_USER_INVENTORY,
+    SQL_USER_INVENTORY_BY_NAME,
+    ingredient_from_row,
+    inventory_by_name,
+    joined_ingredients,
+    linked_ingredient_ids,
+    linked_ingredients,
+    meal_from_row,
+    meal_ingredient_from_row,
+    meals_query,
+    menu_from_row,
+    menu_ingredient_from_row,
+    user_from_row,
+)
+from datatypes import (
+    CacheStats,
+    CookResult,
+    InventoryChange,
+    User,
+    Ingredient,
+    Meal,
+    Menu,
+    Menu_Ingredient,
+    Meal_Ingredient,
+)
+from menu_index import MenuIngredientIndex
+
+# DatabaseAdapter methods without an async counterpart: per-thread
+# connection scopes, fork handling, LISTEN and multi-statement transactions
+SYNC_ONLY = frozenset({
+    "after_fork", "open_scope", "release", "pooled", "listen", "transaction", "in_transaction",
+})
+
+_cursor_ids = itertools.count(1)
+
+
+class AsyncDatabaseAdapter:
+    """
+    asyncio counterpart of DatabaseAdapter with the same method surface.
+
+    Reads run on a psycopg 3 AsyncConnectionPool using the same SQL as the
+    sync adapter, so one worker can keep hundreds of requests in flight.
+    Writes are rare and are handed to the wrapped sync adapter in a worker
+    thread; that keeps cache invalidation in one place, and both adapters
+    share the same CatalogCache.
+
+    Multi-statement transactions and connection management are only
+    available on the sync adapter (see SYNC_ONLY).
+    """
+
+    def __init__(
+        self,
+        sync: DatabaseAdapter,
+        min_connections: int = 1,
+        max_connections: int = 20,
+        checkout_timeout: float = 10.0,
+    ) -> None:
+        self.sync: DatabaseAdapter = sync
+        self.min_connections: int = min_connections
+        self.max_connections: int = max_connections
+        self.checkout_timeout: float = checkout_timeout
+        self.pool: Optional[AsyncConnectionPool] = None
+
+    @property
+    def cache(self) -> Optional[CatalogCache]:
+        return self.sync.cache
+
+    async def connect(self) -> bool:
+        if self.pool is not None:
+            return True
+        self.pool = AsyncConnectionPool(
+            make_conninfo(
+                dbname=self.sync.database,
+                user=self.sync.username,
+                password=self.sync.password,
+                host=self.sync.host,
+                port=self.sync.port,
+            ),
+            min_size=self.min_connections,
+            max_size=self.max_connections,
+            timeout=self.checkout_timeout,
+            # psycopg 3 prepares per connection by itself; 0 = from the first run
+            kwargs={
+                "autocommit": True,
+                "prepare_threshold": 0 if self.sync.prepare_statements else None,
+            },
+            # health check on checkout; broken connections are replaced
+            check=AsyncConnectionPool.check_connection,
+            open=False,
+        )
+        await self.pool.open()
+        return True
+
+    async def disconnect(self) -> bool:
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+        return self.sync.disconnect()
+
+    # --- low-level helpers -------------------------------------------------
+
+    async def _query(self, query: str, params: Sequence[Any]) -> Rows:
+        if self.pool is None:
+            await self.connect()
+        assert self.pool is not None
+        async with self.pool.connection() as conn:
+            cur = await conn.execute(query, tuple(params))
+            if cur.description is None:
+                return []
+            return cast(Rows, await cur.fetchall())
+
+    async def _query_one(self, query: str, params: Sequence[Any]) -> Optional[Row]:
+        rows = await self._query(query, params)
+        return rows[0] if rows else None
+
+    async def _stream(self, query: str, params: Sequence[Any], batch_size: int) -> AsyncIterator[Row]:
+        """Rows through a server-side cursor, `batch_size` per round trip, like the sync `_stream`."""
+        if self.pool is None:
+            await self.connect()
+        assert self.pool is not None
+        async with self.pool.connection() as conn:
+            async with conn.transaction():
+                async with conn.cursor(name=f"stream_{next(_cursor_ids)}") as cur:
+                    cur.itersize = batch_size
+                    await cur.execute(query, tuple(params))
+                    async for row in cur:
+                        yield cast(Row, row)
+
+    def _cache_get(self, key: Tuple[Any, ...]) -> Any:
+        return self.sync._cache_get(key)
+
+    def _cache_put(self, key: Tuple[Any, ...], value: Any) -> None:
+        self.sync._cache_put(key, value)
+
+    def cache_stats(self) -> Optional[CacheStats]:
+        return self.sync.cache_stats()
+
+    def invalidate_ingredient(self, ingredient_id: int) -> None:
+        self.sync.invalidate_ingredient(ingredient_id)
+
+    def invalidate_menu(self, menu_id: int) -> None:
+        self.sync.invalidate_menu(menu_id)
+
+    def invalidate_catalog(self, scope: str) -> None:
+        self.sync.invalidate_catalog(scope)
+
+    async def bump_versions(self, scopes: Sequence[str], channel: str) -> Dict[str, int]:
+        return await asyncio.to_thread(self.sync.bump_versions, scopes, channel)
+
+    async def data_versions(self) -> Dict[str, int]:
+        return await asyncio.to_thread(self.sync.data_versions)
+
+    async def schema_version(self) -> int:
+        return await asyncio.to_thread(self.sync.schema_version)
+
+    # --- Users --------------------------------------------------------------
+
+    async def get_user(self, user_id: int) -> Optional[User]:
+        # The user row and the inventory are independent; fetch them on two
+        # pooled connections at the same time.
+        result_user, result_inventory = await asyncio.gather(
+            self._query(SQL_GET_USER, (user_id,)),
+            self._query(SQL_USER_INVENTORY_BY_NAME, (user_id,)),
+        )
+        if not result_user:
+            return None
+        return user_from_row(result_user[0], inventory_by_name(result_inventory))
+
+    async def list_users(self, limit: int = 100, offset: int = 0) -> List[User]:
+        rows = await self._query(SQL_LIST_USERS, (limit, offset))
+        return [user_from_row(r, None) for r in rows]
+
+    async def list_users_after(self, after_id: Optional[int], limit: int = 100) -> List[User]:
+        if after_id is None:
+            return await self.list_users(limit=limit, offset=0)
+        rows = await self._query(SQL_LIST_USERS_AFTER, (after_id, limit))
+        return [user_from_row(r, None) for r in rows]
+
+    async def stream_users(
+        self, limit: Optional[int] = None, offset: int = 0, batch_size: int = 500
+    ) -> AsyncIterator[User]:
+        async for r in self._stream(SQL_LIST_USERS, (limit, offset), batch_size):
+            yield user_from_row(r, None)
+
+    async def create_user(self, user: User) -> bool:
+        return await asyncio.to_thread(self.sync.create_user, user)
+
+    async def update_user(self, user_id: int, **fields: Any) -> bool:
+        return await asyncio.to_thread(self.sync.update_user, user_id, **fields)
+
+    async def delete_user(self, user_id: int) -> bool:
+        return await asyncio.to_thread(self.sync.delete_user, user_id)
+
+    async def upsert_user_ingredient(
+        self, user_id: int, ingredient_id: int, quantity: float
+    ) -> bool:
+        return await asyncio.to_thread(
+            self.sync.upsert_user_ingredient, user_id, ingredient_id, quantity
+        )
+
+    async def get_user_inventory(self, user_id: int) -> Dict[int, float]:
+        rows = await self._query(SQL_USER_INVENTORY, (user_id,))
+        return {int(r[0]): float(r[1]) for r in rows}
+
+    async def update_user_inventory(
+        self, user_id: int, changes: Sequence[InventoryChange]
+    ) -> Dict[int, float]:
+        return await asyncio.to_thread(self.sync.update_user_inventory, user_id, changes)
+
+    # --- Ingredients -------------------------------------------------------
+
+    async def get_ingredient(self, ingredient_id: int) -> Optional[Ingredient]:
+        cached = self._cache_get(("ingredient", ingredient_id))
+        if cached is not None:
+            return cast(Ingredient, cached)
+        row = await self._query_one(SQL_GET_INGREDIENT, (ingredient_id,))
+        if row is None:
+            return None
+        ingredient = ingredient_from_row(row)
+        self._cache_put(("ingredient", ingredient_id), ingredient)
+        return ingredient
+
+    async def get_ingredients(self, ingredient_ids: Sequence[int]) -> Dict[int, Ingredient]:
+        found: Dict[int, Ingredient] = {}
+        missing: List[int] = []
+        for ingredient_id in dict.fromkeys(ingredient_ids):
+            cached = self._cache_get(("ingredient", ingredient_id))
+            if cached is not None:
+                found[ingredient_id] = cast(Ingredient, cached)
+            else:
+                missing.append(ingredient_id)
+        if not missing:
+            return found
+        for r in await self._query(SQL_GET_INGREDIENTS, (missing,)):
+            ingredient = ingredient_from_row(r)
+            found[ingredient["id"]] = ingredient
+            self._cache_put(("ingredient", ingredient["id"]), ingredient)
+        return found
+
+    async def get_ingredient_by_name(self, name: str) -> Optional[Ingredient]:
+        return await asyncio.to_thread(self.sync.get_ingredient_by_name, name)
+
+    async def list_ingredients(self, limit: int = 200, offset: int = 0) -> List[Ingredient]:
+        cached = self._cache_get(("ingredients", limit, offset))
+        if cached is not None:
+            return list(cast(List[Ingredient], cached))
+        rows = await self._query(SQL_LIST_INGREDIENTS, (limit, offset))
+        ingredients = [ingredient_from_row(r) for r in rows]
+        self._cache_put(("ingredients", limit, offset), ingredients)
+        return list(ingredients)
+
+    async def list_ingredients_after(
+        self, after_name: Optional[str], limit: int = 200
+    ) -> List[Ingredient]:
+        if after_name is None:
+            return await self.list_ingredients(limit=limit, offset=0)
+        rows = await self._query(SQL_LIST_INGREDIENTS_AFTER, (after_name, limit))
+        return [ingredient_from_row(r) for r in rows]
+
+    async def stream_ingredients(
+        self, limit: Optional[int] = None, offset: int = 0, batch_size: int = 500
+    ) -> AsyncIterator[Ingredient]:
+        async for r in self._stream(SQL_LIST_INGREDIENTS, (limit, offset), batch_size):
+            yield ingredient_from_row(r)
+
+    async def create_ingredient(self, ing: Ingredient) -> bool:
+        return await asyncio.to_thread(self.sync.create_ingredient, ing)
+
+    async def update_ingredient(self, ingredient_id: int, **fields: Any) -> bool:
+        return await asyncio.to_thread(self.sync.update_ingredient, ingredient_id, **fields)
+
+    async def delete_ingredient(self, ingredient_id: int) -> bool:
+        return await asyncio.to_thread(self.sync.delete_ingredient, ingredient_id)
+
+    # --- Menus -------------------------------------------------------------
+
+    async def get_menu(self, menu_id: int) -> Optional[Menu]:
+        cached = self._cache_get(("menu", menu_id))
+        if cached is not None:
+            return cast(Menu, cached)
+        row = await self._query_one(SQL_GET_MENU, (menu_id,))
+        if row is None:
+            return None
+        menu = menu_from_row(row)
+        self._cache_put(("menu", menu_id), menu)
+        return menu
+
+    async def list_menus(
+        self, limit: Optional[int] = 100, offset: int = 0, meal_type: Optional[str] = None
+    ) -> List[Menu]:
+        cached = self._cache_get(("menus", limit, offset, meal_type))
+        if cached is not None:
+            return list(cast(List[Menu], cached))
+        rows = await self._query(SQL_LIST_MENUS, (meal_type, meal_type, limit, offset))
+        out = [menu_from_row(r) for r in rows]
+        self._cache_put(("menus", limit, offset, meal_type), out)
+        return list(out)
+
+    async def list_menus_after(
+        self, after_name: Optional[str], limit: int = 100, meal_type: Optional[str] = None
+    ) -> List[Menu]:
+        if after_name is None:
+            return await self.list_menus(limit=limit, offset=0, meal_type=meal_type)
+        rows = await self._query(SQL_LIST_MENUS_AFTER, (meal_type, meal_type, after_name, limit))
+        return [menu_from_row(r) for r in rows]
+
+    async def stream_menus(
+        self,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        meal_type: Optional[str] = None,
+        batch_size: int = 500,
+    ) -> AsyncIterator[Menu]:
+        async for r in self._stream(SQL_LIST_MENUS, (meal_type, meal_type, limit, offset), batch_size):
+            yield menu_from_row(r)
+
+    async def create_menu(self, menu: Menu) -> Optional[int]:
+        return await asyncio.to_thread(self.sync.create_menu, menu)
+
+    async def update_menu(self, menu_id: int, **fields: Any) -> bool:
+        return await asyncio.to_thread(self.sync.update_menu, menu_id, **fields)
+
+    async def delete_menu(self, menu_id: int) -> bool:
+        return await asyncio.to_thread(self.sync.delete_menu, menu_id)
+
+    async def set_menu_ingredients(self, menu_id: int, items: List[Menu_Ingredient]) -> bool:
+        return await asyncio.to_thread(self.sync.set_menu_ingredients, menu_id, items)
+
+    async def get_menu_ingredients(self, menu_id: int) -> List[Menu_Ingredient]:
+        rows = await self._query(SQL_MENU_INGREDIENTS, (menu_id,))
+        return [menu_ingredient_from_row(r) for r in rows]
+
+    # The planners' catalog-wide reads share the sync adapter's cached copies
+    async def menu_ingredient_index(self) -> MenuIngredientIndex:
+        return await asyncio.to_thread(self.sync.menu_ingredient_index)
+
+    async def get_menu_diet_flags(self) -> Dict[int, int]:
+        return await asyncio.to_thread(self.sync.get_menu_diet_flags)
+
+    async def get_menu_nutrients(self) -> Dict[int, Tuple[float, ...]]:
+        return await asyncio.to_thread(self.sync.get_menu_nutrients)
+
+    # --- Meals -------------------------------------------------------------
+
+    async def get_meal(self, meal_id: int) -> Optional[Meal]:
+        row = await self._query_one(SQL_GET_MEAL, (meal_id,))
+        if row is None:
+            return None
+        meal = meal_from_row(row)
+        meal["ingredients"] = None
+        return meal
+
+    async def list_meals_by_user(
+        self,
+        user_id: int,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+    ) -> List[Meal]:
+        if self.cache is not None:
+            rows = await self._query(
+                *meals_query(user_id, date_from, date_to, ingredients="links")
+            )
+            catalog = await self.get_ingredients(
+                [i for r in rows for i in linked_ingredient_ids(r)]
+            )
+            by_row = [linked_ingredients(r, catalog) for r in rows]
+        else:
+            rows = await self._query(*meals_query(user_id, date_from, date_to))
+            interned: Dict[int, Ingredient] = {}
+            by_row = [joined_ingredients(r, interned) for r in rows]
+
+        meals: List[Meal] = []
+        for r, ingredients in zip(rows, by_row):
+            meal = meal_from_row(r)
+            meal["menu_id"] = meal["menu_id"] or 0  # lists report a missing menu as 0
+            meal["ingredients"] = ingredients  # type: ignore[typeddict-item]
+            meals.append(meal)
+        return meals
+
+    async def create_meal(self, meal: Meal, copy_menu_ingredients: bool = False) -> Optional[int]:
+        return await asyncio.to_thread(self.sync.create_meal, meal, copy_menu_ingredients)
+
+    async def create_meals(
+        self, user_id: int, meals: Sequence[Meal], copy_menu_ingredients: bool = False
+    ) -> List[int]:
+        return await asyncio.to_thread(
+            self.sync.create_meals, user_id, meals, copy_menu_ingredients
+        )
+
+    async def update_meal(self, meal_id: int, **fields: Any) -> bool:
+        return await asyncio.to_thread(self.sync.update_meal, meal_id, **fields)
+
+    async def delete_meal(self, meal_id: int) -> bool:
+        return await asyncio.to_thread(self.sync.delete_meal, meal_id)
+
+    async def set_meal_ingredients(self, meal_id: int, items: List[Meal_Ingredient]) -> bool:
+        return await asyncio.to_thread(self.sync.set_meal_ingredients, meal_id, items)
+
+    async def get_meal_ingredients(self, meal_id: int) -> List[Meal_Ingredient]:
+        rows = await self._query(SQL_MEAL_INGREDIENTS, (meal_id,))
+        return [meal_ingredient_from_row(r) for r in rows]
+
+    async def cook_meal(self, meal_id: int) -> CookResult:
+        return await asyncio.to_thread(self.sync.cook_meal, meal_id)
+
+    async def cook_meals(self, user_id: int, meal_date: date) -> CookResult:
+        return await asyncio.to_thread(self.sync.cook_meals, user_id, meal_date)
+
+    # --- Shopping list -----------------------------------------------------
+
+    async def get_required_ingredients(
+        self, user_id: int, date_from: date, date_to: date
+    ) -> Dict[int, float]:
+        rows = await self._query(SQL_REQUIRED_INGREDIENTS, (user_id, date_from, date_to))
+        return {int(r[0]): float(r[1]) for r in rows}
+
+    async def get_shopping_list(
+        self, user_id: int, date_from: date, date_to: date
+    ) -> List[Dict[str, Ingredient | float]]:
+        rows = await self._query(SQL_SHOPPING_LIST, (user_id, date_from, date_to, user_id))
+        return [
+            {"ingredient": ingredient_from_row(r), "quantity": float(r[12])}
+            for r in rows
+        ]
@@ -0,0 +1,350 @@
+"""
+Benchmark for the API and DatabaseAdapter hot paths.
+
+Seeds a local Postgres with synthetic users, menus, ingredients and weeks of
+meals, then measures latency percentiles and throughput for the planner,
+shopping list and meal endpoints (through the Flask test client) and for the
+adapter reads they are built on.
+
+    python benchmark.py --database sagdu_bench --users 50 --menus 300 --weeks 4
+    python benchmark.py --database sagdu_bench --save-baseline   # new baseline
+    python benchmark.py --database sagdu_bench                   # compare with it
+
+The benchmark applies every migration in infra/init and seeds data, so it
+needs its own database: --database (or BENCH_PGDATABASE) is required and the
+development database "sagdu" is refused. Create it once with
+`createdb sagdu_bench`. The other connection settings come from
+PGHOST/PGPORT/PGUSER/PGPASSWORD like the API itself. Seeded rows use ids from
+BENCH_ID_BASE upwards and menus are prefixed with "bench-".
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, TypedDict
+
+from database_adapter import DatabaseAdapter
+
+BENCH_ID_BASE = 9_000_000
+# The API's default database; never migrated or seeded by the benchmark
+DEV_DATABASE = "sagdu"
+INIT_DIR = Path(__file__).resolve().parent.parent / "infra" / "init"
+DEFAULT_BASELINE = Path(__file__).resolve().parent / "benchmark-baseline.json"
+
+
+class CaseResult(TypedDict):
+    iterations: int
+    concurrency: int
+    mean_ms: float
+    p50_ms: float
+    p90_ms: float
+    p99_ms: float
+    max_ms: float
+    throughput_rps: float
+
+
+class Report(TypedDict):
+    params: Dict[str, int]
+    results: Dict[str, CaseResult]
+
+
+# --- seeding ----------------------------------------------------------------
+
+def ensure_schema(db: DatabaseAdapter) -> None:
+    """Apply the schema and migrations from infra/init (all idempotent), but not the mock data."""
+    for script in sorted(INIT_DIR.glob("*.sql")):
+        if "mock" in script.name:
+            continue
+        print(f"Applying {script.name}…")
+        db._execute(script.read_text(), ())
+
+
+def cleanup(db: DatabaseAdapter) -> None:
+    with db.transaction():
+        # meals, meal_ingredient and user_ingredient cascade from user
+        db._execute('DELETE FROM app."user" WHERE id >= %s', (BENCH_ID_BASE,))
+        db._execute("DELETE FROM app.menu WHERE name LIKE 'bench-%%'", ())
+        db._execute("DELETE FROM app.ingredient WHERE id >= %s", (BENCH_ID_BASE,))
+
+
+def seed(db: DatabaseAdapter, users: int, menus: int, ingredients: int, weeks: int) -> None:
+    print(
+        f"Seeding {users} users, {menus} menus, {ingredients} ingredients, "
+        f"{weeks} week(s) of meals…"
+    )
+    with db.transaction():
+        db._execute(
+            """
+            INSERT INTO app.ingredient
+            (id, name, calories, protein, carbs, fat, fiber,
+             vegetarian, vegan, gluten_free, lactose_free, soy_free)
+            SELECT g, 'bench-ingredient-' || g,
+                   round((random() * 9)::numeric, 3), round((random() * 0.3)::numeric, 3),
+                   round((random() * 0.8)::numeric, 3), round((random() * 0.5)::numeric, 3),
+                   round((random() * 0.1)::numeric, 3),
+                   g %% 2 = 0, g %% 4 = 0, g %% 3 <> 0, g %% 5 <> 0, g %% 7 <> 0
+            FROM generate_series(%s, %s) AS g
+            """,
+            (BENCH_ID_BASE, BENCH_ID_BASE + ingredients - 1),
+        )
+        db._execute(
+            """
+            INSERT INTO app.menu(name, description, type, cooking_time, recipe)
+            SELECT 'bench-menu-' || g, 'Benchmark menu ' || g,
+                   ARRAY[(ARRAY['breakfast', 'lunch', 'dinner'])[1 + g %% 3]],
+                   10 + g %% 50, '[]'::jsonb
+            FROM generate_series(1, %s) AS g
+            """,
+            (menus,),
+        )
+        # 4-12 ingredients per menu, spread deterministically over the catalog
+        db._execute(
+            """
+            INSERT INTO app.menu_ingredient(menu_id, ingredient_id, quantity)
+            SELECT m.id, %s + ((m.id * 7919 + k * 104729) %% %s), 10 + (k * 37) %% 200
+            FROM app.menu AS m
+            CROSS JOIN generate_series(1, 12) AS k
+            WHERE m.name LIKE 'bench-%%'
+              AND k <= 4 + m.id %% 9
+            ON CONFLICT DO NOTHING
+            """,
+            (BENCH_ID_BASE, ingredients),
+        )
+        db._execute(
+            """
+            INSERT INTO app."user"
+            (id, name, age, location, vegan, vegetarian,
+             gluten_free, lactose_free, soy_free)
+            SELECT g, 'bench-user-' || g, 20 + g %% 50, 'Bench City',
+                   g %% 10 = 0, g %% 5 = 0, g %% 7 = 0, g %% 11 = 0, FALSE
+            FROM generate_series(%s, %s) AS g
+            """,
+            (BENCH_ID_BASE, BENCH_ID_BASE + users - 1),
+        )
+        db._execute(
+            """
+            WITH bench_menu AS (
+                SELECT id, name, description, type[1] AS type,
+                       row_number() OVER (PARTITION BY type[1] ORDER BY id) - 1 AS n,
+                       count(*) OVER (PARTITION BY type[1]) AS total
+                FROM app.menu
+                WHERE name LIKE 'bench-%%'
+            )
+            INSERT INTO app.meal(user_id, date, type, name, description, people, menu_id)
+            SELECT u.id, current_date + d, m.type, m.name, m.description, 1 + u.id %% 4, m.id
+            FROM app."user" AS u
+            CROSS JOIN generate_series(0, %s) AS d
+            JOIN bench_menu AS m
+              ON m.n = (u.id + d * 31) %% m.total
+            WHERE u.id >= %s
+            """,
+            (weeks * 7 - 1, BENCH_ID_BASE),
+        )
+        db._execute(
+            """
+            INSERT INTO app.meal_ingredient(meal_id, ingredient_id, quantity)
+            SELECT ml.id, mi.ingredient_id, mi.quantity
+            FROM app.meal AS ml
+            JOIN app.menu_ingredient AS mi
+              ON mi.menu_id = ml.menu_id
+            WHERE ml.user_id >= %s
+            """,
+            (BENCH_ID_BASE,),
+        )
+        db._execute(
+            """
+            INSERT INTO app.user_ingredient(user_id, ingredient_id, quantity)
+            SELECT u.id, %s + ((u.id + k * 13) %% %s), 100 * k
+            FROM app."user" AS u
+            CROSS JOIN generate_series(1, 20) AS k
+            WHERE u.id >= %s
+            ON CONFLICT DO NOTHING
+            """,
+            (BENCH_ID_BASE, ingredients, BENCH_ID_BASE),
+        )
+    db._execute("ANALYZE", ())
+
+
+# --- measuring --------------------------------------------------------------
+
+def percentile(sorted_ms: List[float], pct: float) -> float:
+    if not sorted_ms:
+        return 0.0
+    index = min(len(sorted_ms) - 1, max(0, round(pct / 100 * len(sorted_ms)) - 1))
+    return sorted_ms[index]
+
+
+def measure(
+    call: Callable[[int], object], user_ids: List[int], iterations: int, warmup: int, concurrency: int
+) -> CaseResult:
+    for i in range(warmup):
+        call(user_ids[i % len(user_ids)])
+
+    def timed(i: int) -> float:
+        start = time.perf_counter()
+        call(user_ids[i % len(user_ids)])
+        return (time.perf_counter() - start) * 1000
+
+    wall_start = time.perf_counter()
+    if concurrency > 1:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            samples = list(pool.map(timed, range(iterations)))
+    else:
+        samples = [timed(i) for i in range(iterations)]
+    wall = time.perf_counter() - wall_start
+
+    samples.sort()
+    return {
+        "iterations": iterations,
+        "concurrency": concurrency,
+        "mean_ms": sum(samples) / len(samples),
+        "p50_ms": percentile(samples, 50),
+        "p90_ms": percentile(samples, 90),
+        "p99_ms": percentile(samples, 99),
+        "max_ms": samples[-1],
+        "throughput_rps": iterations / wall if wall > 0 else 0.0,
+    }
+
+
+def build_cases(db: DatabaseAdapter) -> Dict[str, Callable[[int], object]]:
+    # Imported late: app.py builds its own pooled adapter at import time.
+    from app import create_app
+
+    client = create_app().test_client()
+
+    def get(path: str) -> None:
+        res = client.get(path)
+        if res.status_code != 200:
+            raise RuntimeError(f"GET {path} -> {res.status_code}: {res.get_data(as_text=True)}")
+
+    today = date.today()
+    week_end = today + timedelta(days=7)
+    return {
+        "GET /users/<id>/create_meals": lambda uid: get(f"/users/{uid}/create_meals"),
+        "GET /users/<id>/shopping_list": lambda uid: get(f"/users/{uid}/shopping_list"),
+        "GET /users/<id>/meals": lambda uid: get(f"/users/{uid}/meals"),
+        "db.list_meals_by_user": lambda uid: db.list_meals_by_user(uid, today, week_end),
+        "db.get_user": lambda uid: db.get_user(uid),
+    }
+
+
+# --- baseline ---------------------------------------------------------------
+
+def compare(report: Report, baseline: Report, tolerance: float) -> bool:
+    """Print the delta per case; returns False if any p50/p99 regressed beyond `tolerance`."""
+    if baseline["params"] != report["params"]:
+        print(f"note: baseline was recorded with {baseline['params']}")
+    ok = True
+    print(f"\n{'case':36} {'p50 ms':>10} {'Δ':>8} {'p99 ms':>10} {'Δ':>8} {'rps':>9} {'Δ':>8}")
+    for name, result in report["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            print(f"{name:36} {result['p50_ms']:10.2f} {'new':>8} {result['p99_ms']:10.2f}")
+            continue
+
+        def delta(now: float, before: float) -> float:
+            return (now - before) / before * 100 if before else 0.0
+
+        d50 = delta(result["p50_ms"], base["p50_ms"])
+        d99 = delta(result["p99_ms"], base["p99_ms"])
+        drps = delta(result["throughput_rps"], base["throughput_rps"])
+        regressed = d50 > tolerance or d99 > tolerance
+        ok = ok and not regressed
+        print(
+            f"{name:36} {result['p50_ms']:10.2f} {d50:+7.1f}% {result['p99_ms']:10.2f} "
+            f"{d99:+7.1f}% {result['throughput_rps']:9.1f} {drps:+7.1f}%"
+            + ("  REGRESSION" if regressed else "")
+        )
+    return ok
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--menus", type=int, default=150)
+    parser.add_argument("--ingredients", type=int, default=300)
+    parser.add_argument("--weeks", type=int, default=4)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE)
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=10.0, help="allowed slowdown in percent")
+    parser.add_argument("--skip-seed", action="store_true", help="reuse previously seeded data")
+    parser.add_argument("--keep-data", action="store_true", help="do not delete seeded data afterwards")
+    parser.add_argument(
+        "--database",
+        default=os.getenv("BENCH_PGDATABASE"),
+        help="database to migrate, seed and measure (default: $BENCH_PGDATABASE)",
+    )
+    args = parser.parse_args(argv)
+    if not args.database:
+        parser.error("a benchmark database is required: --database or BENCH_PGDATABASE")
+    if args.database == DEV_DATABASE:
+        parser.error(f"refusing to migrate and seed the development database {DEV_DATABASE!r}")
+    # The in-process API (create_app) connects through PGDATABASE as well
+    os.environ["PGDATABASE"] = args.database
+
+    db = DatabaseAdapter(
+        host=os.getenv("PGHOST", "127.0.0.1"),
+        username=os.getenv("PGUSER", "postgres"),
+        password=os.getenv("PGPASSWORD", "postgres"),
+        database=args.database,
+        port=int(os.getenv("PGPORT", "5432")),
+        min_connections=1,
+        max_connections=max(args.concurrency, 1),
+    )
+    if not db.connect():
+        print("DB connect failed")
+        return 2
+
+    try:
+        ensure_schema(db)
+        if not args.skip_seed:
+            cleanup(db)
+            seed(db, args.users, args.menus, args.ingredients, args.weeks)
+
+        user_ids = list(range(BENCH_ID_BASE, BENCH_ID_BASE + args.users))
+        report: Report = {
+            "params": {
+                "users": args.users,
+                "menus": args.menus,
+                "ingredients": args.ingredients,
+                "weeks": args.weeks,
+                "iterations": args.iterations,
+                "concurrency": args.concurrency,
+            },
+            "results": {},
+        }
+        for name, call in build_cases(db).items():
+            result = measure(call, user_ids, args.iterations, args.warmup, args.concurrency)
+            report["results"][name] = result
+            print(
+                f"{name:36} p50 {result['p50_ms']:8.2f} ms  p90 {result['p90_ms']:8.2f} ms  "
+                f"p99 {result['p99_ms']:8.2f} ms  {result['throughput_rps']:8.1f} req/s"
+            )
+
+        if args.save_baseline:
+            args.baseline.write_text(json.dumps(report, indent=2) + "\n")
+            print(f"Baseline written to {args.baseline}")
+            return 0
+        if args.baseline.exists():
+            baseline: Report = json.loads(args.baseline.read_text())
+            return 0 if compare(report, baseline, args.tolerance) else 1
+        print(f"No baseline at {args.baseline}; run with --save-baseline to create one")
+        return 0
+    finally:
+        if not args.keep_data:
+            cleanup(db)
+        db.disconnect()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,113 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Iterable, Tuple
+import threading
+import time
+
+from datatypes import CacheStats
+
+
+Key = Tuple[Hashable, ...]
+
+_MISSING = object()
+
+
+class CatalogCache:
+    """
+    Size- and TTL-bounded LRU cache for the ingredient and menu catalogs.
+
+    Keys are tuples whose first element is the namespace, e.g.
+    ("ingredient", 12) or ("menus", None, 0), so a whole catalog can be
+    dropped with `invalidate_namespace`. Cached values are shared between
+    requests and must be treated as read-only.
+
+    The cache lives in-process: writes made by another API process are
+    picked up when its version bump arrives (versions.DataVersions), other
+    writes once the TTL expires.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 2048,
+        ttl: float = 300.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if max_entries < 1:
+            raise ValueError("max_entries must be >= 1")
+        self.max_entries: int = max_entries
+        self.ttl: float = ttl
+        self._clock = clock
+        self._entries: "OrderedDict[Key, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._invalidations = 0
+
+    def get(self, key: Key, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._entries.get(key, _MISSING)
+            if entry is _MISSING:
+                self._misses += 1
+                return default
+            expires_at, value = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                self._evictions += 1
+                self._misses += 1
+                return default
+            self._entries.move_to_end(key)
+            self._hits += 1
+            return value
+
+    def put(self, key: Key, value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._evictions += 1
+
+    def invalidate(self, *keys: Key) -> None:
+        with self._lock:
+            for key in keys:
+                if self._entries.pop(key, _MISSING) is not _MISSING:
+                    self._invalidations += 1
+
+    def invalidate_namespace(self, *namespaces: Hashable) -> None:
+        self._invalidate_where(lambda key: key[0] in namespaces)
+
+    def invalidate_matching(self, namespace: Hashable, values: Iterable[Any]) -> None:
+        """Drop entries of `namespace` whose cached value is one of `values` (e.g. name -> id)."""
+        targets = set(values)
+        with self._lock:
+            stale = [
+                k for k, (_, v) in self._entries.items() if k[0] == namespace and v in targets
+            ]
+            for key in stale:
+                del self._entries[key]
+            self._invalidations += len(stale)
+
+    def clear(self) -> None:
+        self._invalidate_where(lambda key: True)
+
+    def stats(self) -> CacheStats:
+        with self._lock:
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "invalidations": self._invalidations,
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+            }
+
+    def _invalidate_where(self, predicate: Callable[[Key], bool]) -> None:
+        with self._lock:
+            stale = [k for k in self._entries if predicate(k)]
+            for key in stale:
+                del self._entries[key]
+            self._invalidations += len(stale)
+
@@ -1,30 +1,407 @@
 from __future__ import annotations
 
-from typing import Any, Dict, List, Optional, Sequence, Tuple, cast
+from typing import (
+    Any, Callable, Dict, Iterator, List, Mapping, Optional, Sequence, Set, Tuple, cast
+)
+from contextlib import contextmanager
 from datetime import date
+import hashlib
+import itertools
 import json
+import re
+import threading
+import time
 
-from psycopg2 import connect, OperationalError
-from psycopg2.extensions import connection as PGConnection
+from psycopg2 import connect, OperationalError, InterfaceError
+from psycopg2.errors import InvalidSqlStatementName
+from psycopg2.extensions import (
+    connection as PGConnection,
+    TRANSACTION_STATUS_IDLE,
+    TRANSACTION_STATUS_UNKNOWN,
+)
+from psycopg2.pool import ThreadedConnectionPool
 
+from catalog_cache import CatalogCache
+from menu_index import MenuIngredientIndex
 from datatypes import (
+    CacheStats,
     User,
     Ingredient,
     Meal,
     Menu,
     Menu_Ingredient,
     Meal_Ingredient,
+    InventoryChange,
+    CookResult,
 )
 
 
 Row = Tuple[Any, ...]
 Rows = List[Row]
+# (sql, seconds, rows fetched) -> None
+QueryHook = Callable[[str, float, int], None]
+
+# Bits of menu.diet_flags (infra/init/004_menu_diet_flags.sql): a bit is set
+# when every ingredient of the menu has the flag.
+DIET_FLAGS: Dict[str, int] = {
+    "vegetarian": 1,
+    "vegan": 2,
+    "gluten_free": 4,
+    "lactose_free": 8,
+    "soy_free": 16,
+}
+
+
+def diet_mask(flags: Mapping[str, Any]) -> int:
+    """Bitmask of the DIET_FLAGS set in `flags` (a User, an Ingredient, ...)."""
+    mask = 0
+    for name, bit in DIET_FLAGS.items():
+        if flags.get(name):
+            mask |= bit
+    return mask
+
+
+# Catalog-wide per-menu aggregates kept in the catalog cache; any menu,
+# ingredient or menu_ingredient write invalidates them.
+MENU_AGGREGATES = ("menu_diet_flags", "menu_nutrients")
+
+NUTRIENTS = ("calories", "protein", "carbs", "fat", "fiber")
+
+# Names for server-side cursors; unique within the process
+_cursor_ids = itertools.count(1)
+
+# Highest migration in infra/init the code relies on (see app.schema_migration)
+REQUIRED_SCHEMA_VERSION = 6
+
+# --- prepared statements ---------------------------------------------------
+
+
+class PreparingConnection(PGConnection):
+    """psycopg2 connection that remembers which statements it has PREPAREd."""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.prepared: Set[str] = set()
+
+
+_PLACEHOLDER = re.compile(r"%([%s])")
+# sql -> (statement name, PREPARE statement, EXECUTE statement with %s args)
+_statements: Dict[str, Tuple[str, str, str]] = {}
+
+
+def prepared_statement(sql: str) -> Tuple[str, str, str]:
+    """
+    Server-side form of a %s-style statement. The name is derived from the
+    text, so every connection and process agrees on it.
+    """
+    statement = _statements.get(sql)
+    if statement is not None:
+        return statement
+    count = 0
+
+    def number(m: "re.Match[str]") -> str:
+        nonlocal count
+        if m.group(1) == "%":
+            return "%"
+        count += 1
+        return f"${count}"
+
+    body = _PLACEHOLDER.sub(number, sql)
+    name = "sagdu_" + hashlib.sha1(sql.encode()).hexdigest()[:16]
+    args = f" ({', '.join(['%s'] * count)})" if count else ""
+    statement = (name, f"PREPARE {name} AS {body}", f"EXECUTE {name}{args}")
+    _statements[sql] = statement
+    return statement
+
+
+# --- SQL shared with AsyncDatabaseAdapter ----------------------------------
+
+INGREDIENT_COLUMNS = """id, name, calories, protein, carbs, fat, fiber,
+                   vegetarian, vegan, gluten_free, lactose_free, soy_free"""
+
+SQL_GET_USER = """
+    SELECT id, name, age, location, vegan, vegetarian,
+           gluten_free, lactose_free, soy_free
+    FROM app."user"
+    WHERE id = %s
+"""
+
+SQL_USER_INVENTORY_BY_NAME = """
+    SELECT
+      i.name      AS ingredient_name,
+      ui.quantity AS ingredient_quantity
+    FROM app.user_ingredient AS ui
+    JOIN app.ingredient AS i
+      ON i.id = ui.ingredient_id
+    WHERE ui.user_id = %s
+      AND ui.quantity > 0
+    ORDER BY i.name
+"""
+
+SQL_LIST_USERS = """
+    SELECT id, name, age, location, vegan, vegetarian,
+           gluten_free, lactose_free, soy_free
+    FROM app."user"
+    ORDER BY id
+    LIMIT %s OFFSET %s
+"""
+
+# Keyset pages: seek past the last key of the previous page via the primary
+# key / unique name index instead of scanning and discarding OFFSET rows.
+SQL_LIST_USERS_AFTER = """
+    SELECT id, name, age, location, vegan, vegetarian,
+           gluten_free, lactose_free, soy_free
+    FROM app."user"
+    WHERE id > %s
+    ORDER BY id
+    LIMIT %s
+"""
+
+SQL_USER_INVENTORY = """
+    SELECT ingredient_id, quantity
+    FROM app.user_ingredient
+    WHERE user_id = %s AND quantity > 0
+    ORDER BY ingredient_id
+"""
+
+# Deltas are applied to the conflicting (locked) row, not to a snapshot
+SQL_UPSERT_INVENTORY = """
+    WITH incoming AS (
+        SELECT *
+        FROM unnest(%s::bigint[], %s::numeric[], %s::boolean[])
+             AS t(ingredient_id, quantity, is_delta)
+    )
+    INSERT INTO app.user_ingredient(user_id, ingredient_id, quantity)
+    SELECT %s::bigint, ingredient_id, GREATEST(quantity, 0)
+    FROM incoming
+    ON CONFLICT (user_id, ingredient_id)
+    DO UPDATE SET quantity = (
+        SELECT CASE WHEN inc.is_delta
+                    THEN GREATEST(app.user_ingredient.quantity + inc.quantity, 0)
+                    ELSE inc.quantity
+               END
+        FROM incoming AS inc
+        WHERE inc.ingredient_id = EXCLUDED.ingredient_id
+    )
+"""
+
+# The SELECT sees the rows as they were before the DELETE; those are all 0
+SQL_PRUNE_INVENTORY = """
+    WITH removed AS (
+        DELETE FROM app.user_ingredient
+        WHERE user_id = %s
+          AND ingredient_id = ANY(%s::bigint[])
+          AND quantity = 0
+    )
+    SELECT ingredient_id, quantity
+    FROM app.user_ingredient
+    WHERE user_id = %s AND quantity > 0
+    ORDER BY ingredient_id
+"""
+
+SQL_GET_INGREDIENT = f"""
+    SELECT {INGREDIENT_COLUMNS}
+    FROM app.ingredient
+    WHERE id = %s
+"""
+
+SQL_GET_INGREDIENTS = f"""
+    SELECT {INGREDIENT_COLUMNS}
+    FROM app.ingredient
+    WHERE id = ANY(%s::bigint[])
+"""
+
+SQL_LIST_INGREDIENTS = f"""
+    SELECT {INGREDIENT_COLUMNS}
+    FROM app.ingredient
+    ORDER BY name
+    LIMIT %s OFFSET %s
+"""
+
+# ingredient.name is UNIQUE, so it is a complete sort key on its own
+SQL_LIST_INGREDIENTS_AFTER = f"""
+    SELECT {INGREDIENT_COLUMNS}
+    FROM app.ingredient
+    WHERE name > %s
+    ORDER BY name
+    LIMIT %s
+"""
+
+SQL_GET_MENU = """
+    SELECT id, name, description, type, cooking_time, recipe
+    FROM app.menu
+    WHERE id = %s
+"""
+
+# LIMIT NULL means "no limit" in Postgres; used to load the full catalog.
+# A NULL meal_type disables the filter; otherwise the GIN index on type is used.
+SQL_LIST_MENUS = """
+    SELECT id, name, description, type, cooking_time, recipe
+    FROM app.menu
+    WHERE %s::text IS NULL OR type @> ARRAY[%s::text]
+    ORDER BY name
+    LIMIT %s OFFSET %s
+"""
+
+# menu.name is UNIQUE as well
+SQL_LIST_MENUS_AFTER = """
+    SELECT id, name, description, type, cooking_time, recipe
+    FROM app.menu
+    WHERE (%s::text IS NULL OR type @> ARRAY[%s::text])
+      AND name > %s
+    ORDER BY name
+    LIMIT %s
+"""
+
+SQL_MENU_NUTRIENTS = """
+    SELECT mi.menu_id,
+           SUM(mi.quantity * i.calories),
+           SUM(mi.quantity * i.protein),
+           SUM(mi.quantity * i.carbs),
+           SUM(mi.quantity * i.fat),
+           SUM(mi.quantity * i.fiber)
+    FROM app.menu_ingredient AS mi
+    JOIN app.ingredient AS i
+      ON i.id = mi.ingredient_id
+    GROUP BY mi.menu_id
+"""
+
+SQL_ALL_MENU_INGREDIENTS = """
+    SELECT menu_id, ingredient_id, quantity
+    FROM app.menu_ingredient
+"""
+
+SQL_MENU_INGREDIENTS = """
+    SELECT menu_id, ingredient_id, quantity
+    FROM app.menu_ingredient
+    WHERE menu_id = %s
+    ORDER BY ingredient_id
+"""
+
+SQL_GET_MEAL = """
+    SELECT id, user_id, date, type, name, description, people, menu_id
+    FROM app.meal
+    WHERE id = %s
+"""
+
+SQL_MEAL_INGREDIENTS = """
+    SELECT meal_id, ingredient_id, quantity
+    FROM app.meal_ingredient
+    WHERE meal_id = %s
+    ORDER BY ingredient_id
+"""
+
+# meal_requirement is kept up to date by triggers (infra/init/006_meal_requirement.sql):
+# one row per user, day and ingredient, so a range reads days x ingredients
+# rows however many meals are planned.
+SQL_REQUIRED_INGREDIENTS = """
+    SELECT ingredient_id, SUM(quantity)
+    FROM app.meal_requirement
+    WHERE user_id = %s
+      AND date >= %s
+      AND date <= %s
+    GROUP BY ingredient_id
+    ORDER BY ingredient_id
+"""
+
+# Marks the selected meals cooked and deducts their ingredients (scaled by
+# people) from the owners' inventory, clamped at 0, in one statement. Meals
+# that are already cooked are skipped, so nothing is deducted twice.
+SQL_COOK_MEALS = """
+    WITH cooked AS (
+        UPDATE app.meal
+        SET cooked_at = now()
+        WHERE {where}
+          AND cooked_at IS NULL
+        RETURNING id, user_id, people
+    ),
+    used AS (
+        SELECT c.user_id, mi.ingredient_id, SUM(mi.quantity * c.people) AS quantity
+        FROM cooked AS c
+        JOIN app.meal_ingredient AS mi
+          ON mi.meal_id = c.id
+        GROUP BY c.user_id, mi.ingredient_id
+    ),
+    deducted AS (
+        UPDATE app.user_ingredient AS ui
+        SET quantity = GREATEST(ui.quantity - u.quantity, 0)
+        FROM used AS u
+        WHERE ui.user_id = u.user_id
+          AND ui.ingredient_id = u.ingredient_id
+        RETURNING ui.ingredient_id, ui.quantity
+    )
+    SELECT
+        (SELECT COALESCE(array_agg(id ORDER BY id), '{{}}') FROM cooked),
+        (SELECT COALESCE(array_agg(ingredient_id ORDER BY ingredient_id), '{{}}') FROM deducted),
+        (SELECT COALESCE(array_agg(quantity ORDER BY ingredient_id), '{{}}') FROM deducted)
+"""
+SQL_COOK_MEAL = SQL_COOK_MEALS.format(where="id = %s")
+SQL_COOK_MEALS_ON_DATE = SQL_COOK_MEALS.format(where="user_id = %s AND date = %s")
+
+SQL_SHOPPING_LIST = """
+    WITH required AS (
+        SELECT ingredient_id, SUM(quantity) AS quantity
+        FROM app.meal_requirement
+        WHERE user_id = %s
+          AND date >= %s
+          AND date <= %s
+        GROUP BY ingredient_id
+    )
+    SELECT
+        i.id,
+        i.name,
+        i.calories,
+        i.protein,
+        i.carbs,
+        i.fat,
+        i.fiber,
+        i.vegetarian,
+        i.vegan,
+        i.gluten_free,
+        i.lactose_free,
+        i.soy_free,
+        r.quantity - COALESCE(ui.quantity, 0) AS missing
+    FROM required AS r
+    JOIN app.ingredient AS i
+      ON i.id = r.ingredient_id
+    LEFT JOIN app.user_ingredient AS ui
+      ON ui.user_id = %s
+     AND ui.ingredient_id = r.ingredient_id
+    WHERE r.quantity > COALESCE(ui.quantity, 0)
+    ORDER BY i.name
+"""
 
 
 class DatabaseAdapter:
+    """
+    Thin typed wrapper around the `app` schema.
+
+    With `max_connections == 0` the adapter keeps a single connection in
+    `self.connection` (handy for scripts). With `max_connections > 0` it runs
+    in pooled mode: every thread checks out its own connection, so methods can
+    run concurrently on different connections.
+
+    An optional `CatalogCache` serves ingredient and menu reads from memory;
+    the adapter's own write methods invalidate it.
+    """
+
     def __init__(
-        self, host: str, username: str, password: str, database: str, port: int = 5432
+        self,
+        host: str,
+        username: str,
+        password: str,
+        database: str,
+        port: int = 5432,
+        min_connections: int = 0,
+        max_connections: int = 0,
+        checkout_timeout: float = 10.0,
+        cache: Optional[CatalogCache] = None,
+        prepare_statements: bool = True,
     ) -> None:
+        if max_connections < 0 or min_connections < 0:
+            raise ValueError("pool sizes must be >= 0")
+        if max_connections and min_connections > max_connections:
+            raise ValueError("min_connections must be <= max_connections")
         self.host: str = host
         self.username: str = username
         self.password: str = password
@@ -32,15 +409,53 @@ class DatabaseAdapter:
         self.port: int = port
         self.connection: Optional[PGConnection] = None
 
+        self.min_connections: int = min_connections
+        self.max_connections: int = max_connections
+        self.checkout_timeout: float = checkout_timeout
+        self.pool: Optional[ThreadedConnectionPool] = None
+        self._pool_lock = threading.Lock()
+        # ThreadedConnectionPool raises instead of waiting when it is exhausted,
+        # so the semaphore makes callers queue for a free slot.
+        self._slots = threading.BoundedSemaphore(max(max_connections, 1))
+        self._local = threading.local()
+        self.cache: Optional[CatalogCache] = cache
+        self.on_query: Optional[QueryHook] = None
+        # Off for poolers that don't keep server sessions (pgbouncer transaction mode)
+        self.prepare_statements: bool = prepare_statements
+        # Built on first use; rebuilt after menu_index_ttl to see other processes' writes
+        self.menu_index_ttl: float = cache.ttl if cache is not None else 300.0
+        self._menu_index: Optional[MenuIngredientIndex] = None
+        self._menu_index_lock = threading.Lock()
+
+    @property
+    def pooled(self) -> bool:
+        return self.max_connections > 0
+
     def connect(self) -> bool:
         try:
+            if self.pooled:
+                with self._pool_lock:
+                    if self.pool is None:
+                        self.pool = ThreadedConnectionPool(
+                            self.min_connections,
+                            self.max_connections,
+                            dbname=self.database,
+                            user=self.username,
+                            password=self.password,
+                            host=self.host,
+                            port=self.port,
+                            connection_factory=PreparingConnection,
+                        )
+                return True
             self.connection = connect(
                 dbname=self.database,
                 user=self.username,
                 password=self.password,
                 host=self.host,
                 port=self.port,
+                connection_factory=PreparingConnection,
             )
+            self.connection.autocommit = True
             return True
         except OperationalError as e:
             print(f"Connection error: {e}")
@@ -49,6 +464,9 @@ class DatabaseAdapter:
 
     def disconnect(self) -> bool:
         try:
+            if self.pool is not None:
+                self.pool.closeall()
+                self.pool = None
             if self.connection is not None:
                 self.connection.close()
                 self.connection = None
@@ -57,6 +475,253 @@ class DatabaseAdapter:
             print(f"Disconnection error: {e}")
             return False
 
+    def after_fork(self) -> None:
+        """
+        Forget connections inherited from a parent process without closing
+        them (closing would end the parent's sessions over the shared
+        sockets). The child opens its own pool on first use.
+        """
+        self.pool = None
+        self.connection = None
+        self._pool_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max(self.max_connections, 1))
+        self._local = threading.local()
+
+    # --- connection pool ---------------------------------------------------
+
+    def open_scope(self) -> None:
+        """
+        Start a connection scope on the current thread (e.g. one Flask
+        request): the first statement checks out a pooled connection and every
+        later call reuses it until `release()`. Scopes that never touch the
+        database never take a connection.
+        """
+        self._local.scoped = True
+
+    def release(self) -> None:
+        self._local.scoped = False
+        conn = cast(Optional[PGConnection], getattr(self._local, "connection", None))
+        if conn is None:
+            return
+        self._local.connection = None
+        self._give_back(conn)
+
+    def _acquire(self) -> PGConnection:
+        if self.pool is None and not self.connect():
+            raise RuntimeError("Could not connect to database")
+        assert self.pool is not None
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            raise RuntimeError("Timed out waiting for a database connection")
+        try:
+            # A pooled connection may have died while idle (server restart,
+            # network drop); replace it instead of handing it out.
+            for _ in range(self.max_connections + 1):
+                conn = self.pool.getconn()
+                if not conn.closed and not conn.autocommit:
+                    # Freshly opened by the pool, so no transaction is in progress.
+                    conn.autocommit = True
+                if self._healthy(conn):
+                    return conn
+                self.pool.putconn(conn, close=True)
+            raise RuntimeError("Could not obtain a healthy database connection")
+        except Exception:
+            self._slots.release()
+            raise
+
+    def _give_back(self, conn: PGConnection) -> None:
+        assert self.pool is not None
+        try:
+            broken = conn.closed != 0
+            if not broken:
+                try:
+                    self._abort(conn)
+                except (OperationalError, InterfaceError):
+                    broken = True
+            self.pool.putconn(conn, close=broken)
+        finally:
+            self._slots.release()
+
+    @classmethod
+    def _healthy(cls, conn: PGConnection) -> bool:
+        if conn.closed:
+            return False
+        try:
+            if conn.get_transaction_status() == TRANSACTION_STATUS_UNKNOWN:
+                return False
+            cls._abort(conn)
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            return True
+        except (OperationalError, InterfaceError):
+            return False
+
+    @staticmethod
+    def _abort(conn: PGConnection) -> None:
+        """Roll back whatever transaction was left open on `conn`."""
+        # conn.rollback() is a no-op in autocommit mode, so send it ourselves.
+        if conn.get_transaction_status() != TRANSACTION_STATUS_IDLE:
+            with conn.cursor() as cur:
+                cur.execute("ROLLBACK")
+
+    # --- transactions ------------------------------------------------------
+
+    @contextmanager
+    def transaction(self, read_only: bool = False) -> Iterator[None]:
+        """
+        Group statements into one transaction:
+
+            with db.transaction():
+                db.create_meal(...)
+                db.set_meal_ingredients(...)
+
+        Outside of a block every statement commits on its own (autocommit).
+        Inside, nothing commits until the outermost block exits; an exception
+        rolls the block back. Nested blocks become savepoints, so an inner
+        failure can be caught without losing the outer work. `read_only` only
+        applies to the outermost block, which then starts with BEGIN READ ONLY.
+        """
+        depth = cast(int, getattr(self._local, "tx_depth", 0))
+        if depth:
+            savepoint = f"sp_{depth}"
+            self._control(f"SAVEPOINT {savepoint}")
+            self._local.tx_depth = depth + 1
+            try:
+                yield
+            except BaseException:
+                self._control(f"ROLLBACK TO SAVEPOINT {savepoint}")
+                raise
+            else:
+                self._control(f"RELEASE SAVEPOINT {savepoint}")
+            finally:
+                self._local.tx_depth = depth
+            return
+
+        with self._connection() as conn:
+            self._local.tx_conn = conn
+            self._local.tx_depth = 1
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("BEGIN READ ONLY" if read_only else "BEGIN")
+                yield
+            except BaseException:
+                if not conn.closed:
+                    try:
+                        self._abort(conn)
+                    except (OperationalError, InterfaceError):
+                        pass
+                raise
+            else:
+                with conn.cursor() as cur:
+                    cur.execute("COMMIT")
+            finally:
+                self._local.tx_depth = 0
+                self._local.tx_conn = None
+
+    @property
+    def in_transaction(self) -> bool:
+        return cast(int, getattr(self._local, "tx_depth", 0)) > 0
+
+    def _control(self, statement: str) -> None:
+        conn = cast(PGConnection, self._local.tx_conn)
+        with conn.cursor() as cur:
+            cur.execute(statement)
+
+    # --- catalog cache -----------------------------------------------------
+
+    def _cache_get(self, key: Tuple[Any, ...]) -> Any:
+        return self.cache.get(key) if self.cache is not None else None
+
+    def _cache_put(self, key: Tuple[Any, ...], value: Any) -> None:
+        # Rows read inside a transaction may still be rolled back.
+        if self.cache is not None and not self.in_transaction:
+            self.cache.put(key, value)
+
+    def invalidate_ingredient(self, ingredient_id: int) -> None:
+        if self.cache is None:
+            return
+        self.cache.invalidate(("ingredient", ingredient_id))
+        self.cache.invalidate_matching("ingredient_name", [ingredient_id])
+        self.cache.invalidate_namespace("ingredients", *MENU_AGGREGATES)
+
+    def invalidate_menu(self, menu_id: int) -> None:
+        if self.cache is None:
+            return
+        self.cache.invalidate(("menu", menu_id))
+        self.cache.invalidate_namespace("menus", *MENU_AGGREGATES)
+
+    def invalidate_catalog(self, scope: str) -> None:
+        """
+        Forget everything derived from the "ingredients" or "menus" catalog,
+        e.g. after another process changed it (see versions.DataVersions).
+        """
+        if scope == "menus":
+            self._menu_index = None
+        if self.cache is None:
+            return
+        if scope == "ingredients":
+            self.cache.invalidate_namespace("ingredient", "ingredient_name", "ingredients", *MENU_AGGREGATES)
+        elif scope == "menus":
+            self.cache.invalidate_namespace("menu", "menus", *MENU_AGGREGATES)
+
+    def cache_stats(self) -> Optional[CacheStats]:
+        return self.cache.stats() if self.cache is not None else None
+
+    # --- data versions (ETags) ---------------------------------------------
+
+    def bump_versions(self, scopes: Sequence[str], channel: str) -> Dict[str, int]:
+        """
+        Increment the change counters of `scopes` and NOTIFY `channel` with
+        "<scope>:<version>" for each, in one statement. Inside a transaction
+        the notifications go out on commit, together with the data.
+        """
+        rows = self._query(
+            """
+            WITH bumped AS (
+                INSERT INTO app.data_version(scope, version)
+                SELECT DISTINCT unnest(%s::text[]), 1
+                ON CONFLICT (scope)
+                DO UPDATE SET version = app.data_version.version + 1
+                RETURNING scope, version
+            )
+            SELECT scope, version, pg_notify(%s::text, scope || ':' || version)
+            FROM bumped
+            """,
+            (list(scopes), channel),
+            prepare=True,
+        )
+        return {r[0]: int(r[1]) for r in rows}
+
+    def data_versions(self) -> Dict[str, int]:
+        rows = self._query("SELECT scope, version FROM app.data_version", (), prepare=True)
+        return {r[0]: int(r[1]) for r in rows}
+
+    def listen(self, channel: str) -> PGConnection:
+        """
+        A dedicated connection (outside the pool) subscribed to `channel`;
+        poll it and read `conn.notifies`. The caller closes it.
+        """
+        conn = connect(
+            dbname=self.database,
+            user=self.username,
+            password=self.password,
+            host=self.host,
+            port=self.port,
+        )
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f'LISTEN "{channel}"')
+        return conn
+
+    # --- schema ------------------------------------------------------------
+
+    def schema_version(self) -> int:
+        """Highest applied migration; 1 for a database created from 001_db_init.sql only."""
+        row = self._query_one("SELECT to_regclass('app.schema_migration') IS NOT NULL", ())
+        if row is None or not row[0]:
+            return 1
+        row = self._query_one("SELECT COALESCE(MAX(version), 1) FROM app.schema_migration", ())
+        return int(row[0]) if row is not None else 1
+
     # --- low-level helpers -------------------------------------------------
 
     def _ensure_connection(self) -> PGConnection:
@@ -65,114 +730,180 @@ class DatabaseAdapter:
         assert self.connection is not None
         return self.connection
 
-    def _query(self, query: str, params: Sequence[Any]) -> Rows:
+    @contextmanager
+    def _connection(self) -> Iterator[PGConnection]:
+        tx_conn = cast(Optional[PGConnection], getattr(self._local, "tx_conn", None))
+        if tx_conn is not None:
+            yield tx_conn
+            return
+        if not self.pooled:
+            yield self._ensure_connection()
+            return
+        bound = cast(Optional[PGConnection], getattr(self._local, "connection", None))
+        if bound is not None:
+            yield bound
+            return
+        if getattr(self._local, "scoped", False):
+            self._local.connection = self._acquire()
+            yield self._local.connection
+            return
+        # Not inside a scope: borrow a connection for this call only.
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._give_back(conn)
+
+    def _query(self, query: str, params: Sequence[Any], prepare: bool = False) -> Rows:
         """
         Run any SQL. If the statement produces a result set (e.g., SELECT or
         INSERT/UPDATE/DELETE ... RETURNING), fetch and return those rows.
-        For DML, commit the transaction.
-        """
-        conn = self._ensure_connection()
-        with conn.cursor() as cur:
-            cur.execute(query, tuple(params))
-            has_rows = cur.description is not None
-            rows: Rows = cur.fetchall() if has_rows else []
+        Connections run in autocommit mode, so outside of `transaction()`
+        each statement commits (or fails) on its own.
 
-            # Commit for DML (anything that's not a plain SELECT), even if it RETURNs rows
-            if not query.lstrip().upper().startswith("SELECT"):
-                conn.commit()
+        With `prepare` the statement is PREPAREd once per connection and then
+        run with EXECUTE, so Postgres skips parsing and planning. Only use it
+        for fixed SQL (or a bounded set of variants); every distinct text
+        becomes a statement that lives as long as the connection.
+        """
+        with self._connection() as conn:
+            started = time.perf_counter()
+            rows: Rows = []
+            try:
+                with conn.cursor() as cur:
+                    if prepare and self.prepare_statements:
+                        self._execute_prepared(conn, cur, query, tuple(params))
+                    else:
+                        cur.execute(query, tuple(params))
+                    has_rows = cur.description is not None
+                    rows = cur.fetchall() if has_rows else []
+                    return rows
+            finally:
+                if self.on_query is not None:
+                    self.on_query(query, time.perf_counter() - started, len(rows))
 
-            return rows
+    def _execute_prepared(
+        self, conn: PGConnection, cur: Any, query: str, params: Tuple[Any, ...]
+    ) -> None:
+        name, prepare_sql, execute_sql = prepared_statement(query)
+        prepared = cast(PreparingConnection, conn).prepared
+        if name not in prepared:
+            cur.execute(prepare_sql)
+            prepared.add(name)
+        try:
+            cur.execute(execute_sql, params)
+        except InvalidSqlStatementName:
+            # The session lost it (DISCARD ALL, server-side reset). Outside a
+            # transaction nothing was aborted, so prepare again and retry once.
+            prepared.clear()
+            if self.in_transaction:
+                raise
+            cur.execute(prepare_sql)
+            prepared.add(name)
+            cur.execute(execute_sql, params)
 
-    def _query_one(self, query: str, params: Sequence[Any]) -> Optional[Row]:
-        rows = self._query(query, params)
+    def _query_one(
+        self, query: str, params: Sequence[Any], prepare: bool = False
+    ) -> Optional[Row]:
+        rows = self._query(query, params, prepare)
         return rows[0] if rows else None
 
-    def _execute(self, query: str, params: Sequence[Any]) -> bool:
-        self._query(query, params)
+    def _execute(self, query: str, params: Sequence[Any], prepare: bool = False) -> bool:
+        self._query(query, params, prepare)
         return True
 
-    # --- Users --------------------------------------------------------------
+    def _stream(self, query: str, params: Sequence[Any], batch_size: int) -> Iterator[Row]:
+        """
+        Yield rows through a server-side (named) cursor, fetching `batch_size`
+        rows per round trip, so memory stays flat regardless of the result
+        size. Named cursors need a transaction: a read-only one is held, with
+        its connection, until the generator is exhausted or closed.
+        """
+        started = time.perf_counter()
+        count = 0
+        try:
+            with self.transaction(read_only=True):
+                conn = cast(PGConnection, self._local.tx_conn)
+                with conn.cursor(name=f"stream_{next(_cursor_ids)}") as cur:
+                    cur.itersize = batch_size
+                    cur.execute(query, tuple(params))
+                    for row in cur:
+                        count += 1
+                        yield row
+        finally:
+            if self.on_query is not None:
+                self.on_query(query, time.perf_counter() - started, count)
 
-    def get_user(self, user_id: int) -> Optional[User]:
-        result_user = self._query(
-            """
-            SELECT
-                id,
-                name,
-                age,
-                location,
-                vegan,
-                vegetarian,
-                gluten_free,
-                lactose_free,
-                soy_free
-            FROM app."user"
-            WHERE id = %s
+    def _replace_ingredient_rows(
+        self,
+        table: str,
+        owner_column: str,
+        owner_id: int,
+        items: Sequence[Menu_Ingredient] | Sequence[Meal_Ingredient],
+    ) -> bool:
+        """
+        Make the ingredient rows of one menu/meal equal to `items` in a single
+        statement (and therefore a single transaction). Rows that are gone get
+        deleted, new ones inserted, and only changed quantities rewritten.
+        `table`/`owner_column` are fixed identifiers, never user input.
+        """
+        # ON CONFLICT cannot touch the same row twice in one statement, so
+        # duplicate ingredient ids collapse to the last entry.
+        wanted: Dict[int, float] = {
+            int(it["ingredient_id"]): float(it["quantity"]) for it in items
+        }
+        ingredient_ids = list(wanted.keys())
+        quantities = list(wanted.values())
+        return self._execute(
+            f"""
+            WITH incoming AS (
+                SELECT *
+                FROM unnest(%s::bigint[], %s::numeric[]) AS t(ingredient_id, quantity)
+            ),
+            removed AS (
+                DELETE FROM app.{table}
+                WHERE {owner_column} = %s
+                  AND ingredient_id <> ALL(%s::bigint[])
+            )
+            INSERT INTO app.{table}({owner_column}, ingredient_id, quantity)
+            SELECT %s::bigint, ingredient_id, quantity
+            FROM incoming
+            ON CONFLICT ({owner_column}, ingredient_id)
+            DO UPDATE SET quantity = EXCLUDED.quantity
+            WHERE app.{table}.quantity IS DISTINCT FROM EXCLUDED.quantity
             """,
-            (user_id,),
+            (ingredient_ids, quantities, owner_id, ingredient_ids, owner_id),
+            prepare=True,
         )
 
+    # --- Users --------------------------------------------------------------
+
+    def get_user(self, user_id: int) -> Optional[User]:
+        result_user = self._query(SQL_GET_USER, (user_id,), prepare=True)
+
         if not result_user:
             return None
 
-        result_inventory = self._query(
-            """
-            SELECT
-              i.name      AS ingredient_name,
-              ui.quantity AS ingredient_quantity
-            FROM app.user_ingredient AS ui
-            JOIN app.ingredient AS i
-              ON i.id = ui.ingredient_id
-            WHERE ui.user_id = %s
-              AND ui.quantity > 0
-            ORDER BY i.name;
-            """,
-            (user_id,),
-        )
-
-        row = result_user[0]
-        inventory: Dict[str, float] = {
-            cast(str, item[0]): float(item[1]) for item in result_inventory
-        }
-        return {
-            "id": cast(int, row[0]),
-            "name": cast(str, row[1]),
-            "age": cast(int, row[2]),
-            "location": cast(str, row[3]),
-            "vegan": cast(bool, row[4]),
-            "vegetarian": cast(bool, row[5]),
-            "gluten_free": cast(bool, row[6]),
-            "lactose_free": cast(bool, row[7]),
-            "soy_free": cast(bool, row[8]),
-            "inventory": inventory,
-        }
+        result_inventory = self._query(SQL_USER_INVENTORY_BY_NAME, (user_id,), prepare=True)
+        return user_from_row(result_user[0], inventory_by_name(result_inventory))
 
     def list_users(self, limit: int = 100, offset: int = 0) -> List[User]:
-        rows = self._query(
-            """
-            SELECT id, name, age, location, vegan, vegetarian,
-                   gluten_free, lactose_free, soy_free
-            FROM app."user"
-            ORDER BY id
-            LIMIT %s OFFSET %s
-            """,
-            (limit, offset),
-        )
-        return [
-            {
-                "id": cast(int, r[0]),
-                "name": cast(str, r[1]),
-                "age": cast(int, r[2]),
-                "location": cast(str, r[3]),
-                "vegan": cast(bool, r[4]),
-                "vegetarian": cast(bool, r[5]),
-                "gluten_free": cast(bool, r[6]),
-                "lactose_free": cast(bool, r[7]),
-                "soy_free": cast(bool, r[8]),
-                "inventory": None,
-            }
-            for r in rows
-        ]
+        rows = self._query(SQL_LIST_USERS, (limit, offset), prepare=True)
+        return [user_from_row(r, None) for r in rows]
+
+    def list_users_after(self, after_id: Optional[int], limit: int = 100) -> List[User]:
+        """Keyset page: up to `limit` users with an id above `after_id` (None = first page)."""
+        if after_id is None:
+            return self.list_users(limit=limit, offset=0)
+        rows = self._query(SQL_LIST_USERS_AFTER, (after_id, limit), prepare=True)
+        return [user_from_row(r, None) for r in rows]
+
+    def stream_users(
+        self, limit: Optional[int] = None, offset: int = 0, batch_size: int = 500
+    ) -> Iterator[User]:
+        """Like `list_users`, but lazily and in batches; `limit=None` streams all."""
+        for r in self._stream(SQL_LIST_USERS, (limit, offset), batch_size):
+            yield user_from_row(r, None)
 
     def create_user(self, user: User) -> bool:
         return self._execute(
@@ -220,7 +951,9 @@ class DatabaseAdapter:
         )
 
     def delete_user(self, user_id: int) -> bool:
-        return self._execute('DELETE FROM app."user" WHERE id = %s', (user_id,))
+        return self._execute(
+            'DELETE FROM app."user" WHERE id = %s', (user_id,), prepare=True
+        )
 
     # Inventory (user_ingredient)
 
@@ -233,6 +966,7 @@ class DatabaseAdapter:
             return self._execute(
                 "DELETE FROM app.user_ingredient WHERE user_id=%s AND ingredient_id=%s",
                 (user_id, ingredient_id),
+                prepare=True,
             )
         return self._execute(
             """
@@ -242,50 +976,88 @@ class DatabaseAdapter:
             DO UPDATE SET quantity = EXCLUDED.quantity
             """,
             (user_id, ingredient_id, quantity),
+            prepare=True,
         )
 
+    def update_user_inventory(
+        self, user_id: int, changes: Sequence[InventoryChange]
+    ) -> Dict[int, float]:
+        """
+        Apply a batch of inventory changes in one transaction and return the
+        resulting inventory. Each change sets an absolute `quantity` or adds
+        a `delta`; an item ending at 0 is removed. All items go through one
+        multi-row upsert, and deltas are added to the locked current row, so
+        concurrent updates are not lost.
+        """
+        # ON CONFLICT cannot touch the same row twice in one statement, so
+        # changes to the same ingredient are folded first, in order.
+        folded: Dict[int, Tuple[float, bool]] = {}
+        for change in changes:
+            ingredient_id = int(change["ingredient_id"])
+            if "delta" in change:
+                amount, is_delta = folded.get(ingredient_id, (0.0, True))
+                amount += float(change["delta"])
+                folded[ingredient_id] = (amount if is_delta else max(amount, 0.0), is_delta)
+            else:
+                quantity = float(change["quantity"])
+                if quantity < 0:
+                    raise ValueError("quantity must be >= 0")
+                folded[ingredient_id] = (quantity, False)
+        ingredient_ids = list(folded.keys())
+        with self.transaction():
+            if ingredient_ids:
+                self._execute(
+                    SQL_UPSERT_INVENTORY,
+                    (
+                        ingredient_ids,
+                        [q for q, _ in folded.values()],
+                        [d for _, d in folded.values()],
+                        user_id,
+                    ),
+                    prepare=True,
+                )
+            rows = self._query(SQL_PRUNE_INVENTORY, (user_id, ingredient_ids, user_id), prepare=True)
+        return {int(r[0]): float(r[1]) for r in rows}
+
     def get_user_inventory(self, user_id: int) -> Dict[int, float]:
-        rows = self._query(
-            """
-            SELECT ingredient_id, quantity
-            FROM app.user_ingredient
-            WHERE user_id = %s AND quantity > 0
-            ORDER BY ingredient_id
-            """,
-            (user_id,),
-        )
+        rows = self._query(SQL_USER_INVENTORY, (user_id,), prepare=True)
         return {int(r[0]): float(r[1]) for r in rows}
 
     # --- Ingredients -------------------------------------------------------
 
     def get_ingredient(self, ingredient_id: int) -> Optional[Ingredient]:
-        row = self._query_one(
-            """
-            SELECT id, name, calories, protein, carbs, fat, fiber,
-                   vegetarian, vegan, gluten_free, lactose_free, soy_free
-            FROM app.ingredient
-            WHERE id = %s
-            """,
-            (ingredient_id,),
-        )
+        cached = self._cache_get(("ingredient", ingredient_id))
+        if cached is not None:
+            return cast(Ingredient, cached)
+        row = self._query_one(SQL_GET_INGREDIENT, (ingredient_id,), prepare=True)
         if row is None:
             return None
-        return {
-            "id": cast(int, row[0]),
-            "name": cast(str, row[1]),
-            "calories": float(row[2]),
-            "protein": float(row[3]),
-            "carbs": float(row[4]),
-            "fat": float(row[5]),
-            "fiber": float(row[6]),
-            "vegetarian": cast(bool, row[7]),
-            "vegan": cast(bool, row[8]),
-            "gluten_free": cast(bool, row[9]),
-            "lactose_free": cast(bool, row[10]),
-            "soy_free": cast(bool, row[11]),
-        }
+        ingredient = ingredient_from_row(row)
+        self._cache_put(("ingredient", ingredient_id), ingredient)
+        return ingredient
+
+    def get_ingredients(self, ingredient_ids: Sequence[int]) -> Dict[int, Ingredient]:
+        """Bulk lookup by id; only ids missing from the cache hit the database."""
+        found: Dict[int, Ingredient] = {}
+        missing: List[int] = []
+        for ingredient_id in dict.fromkeys(ingredient_ids):
+            cached = self._cache_get(("ingredient", ingredient_id))
+            if cached is not None:
+                found[ingredient_id] = cast(Ingredient, cached)
+            else:
+                missing.append(ingredient_id)
+        if not missing:
+            return found
+        for r in self._query(SQL_GET_INGREDIENTS, (missing,), prepare=True):
+            ingredient = ingredient_from_row(r)
+            found[ingredient["id"]] = ingredient
+            self._cache_put(("ingredient", ingredient["id"]), ingredient)
+        return found
 
     def get_ingredient_by_name(self, name: str) -> Optional[Ingredient]:
+        cached_id = self._cache_get(("ingredient_name", name))
+        if cached_id is not None:
+            return self.get_ingredient(cast(int, cached_id))
         row = self._query_one(
             """
             SELECT id, name, calories, protein, carbs, fat, fiber,
@@ -294,42 +1066,42 @@ class DatabaseAdapter:
             WHERE name = %s
             """,
             (name,),
+            prepare=True,
         )
         if row is None:
             return None
-        return self.get_ingredient(cast(int, row[0]))
+        ingredient = ingredient_from_row(row)
+        self._cache_put(("ingredient", ingredient["id"]), ingredient)
+        self._cache_put(("ingredient_name", name), ingredient["id"])
+        return ingredient
 
     def list_ingredients(self, limit: int = 200, offset: int = 0) -> List[Ingredient]:
-        rows = self._query(
-            """
-            SELECT id, name, calories, protein, carbs, fat, fiber,
-                   vegetarian, vegan, gluten_free, lactose_free, soy_free
-            FROM app.ingredient
-            ORDER BY name
-            LIMIT %s OFFSET %s
-            """,
-            (limit, offset),
-        )
-        return [
-            {
-                "id": cast(int, r[0]),
-                "name": cast(str, r[1]),
-                "calories": float(r[2]),
-                "protein": float(r[3]),
-                "carbs": float(r[4]),
-                "fat": float(r[5]),
-                "fiber": float(r[6]),
-                "vegetarian": cast(bool, r[7]),
-                "vegan": cast(bool, r[8]),
-                "gluten_free": cast(bool, r[9]),
-                "lactose_free": cast(bool, r[10]),
-                "soy_free": cast(bool, r[11]),
-            }
-            for r in rows
-        ]
+        cached = self._cache_get(("ingredients", limit, offset))
+        if cached is not None:
+            return list(cast(List[Ingredient], cached))
+        rows = self._query(SQL_LIST_INGREDIENTS, (limit, offset), prepare=True)
+        ingredients = [ingredient_from_row(r) for r in rows]
+        self._cache_put(("ingredients", limit, offset), ingredients)
+        return list(ingredients)
+
+    def list_ingredients_after(
+        self, after_name: Optional[str], limit: int = 200
+    ) -> List[Ingredient]:
+        """Keyset page: up to `limit` ingredients sorting after `after_name` (None = first page)."""
+        if after_name is None:
+            return self.list_ingredients(limit=limit, offset=0)
+        rows = self._query(SQL_LIST_INGREDIENTS_AFTER, (after_name, limit), prepare=True)
+        return [ingredient_from_row(r) for r in rows]
+
+    def stream_ingredients(
+        self, limit: Optional[int] = None, offset: int = 0, batch_size: int = 500
+    ) -> Iterator[Ingredient]:
+        """Like `list_ingredients`, but lazily and in batches, bypassing the cache."""
+        for r in self._stream(SQL_LIST_INGREDIENTS, (limit, offset), batch_size):
+            yield ingredient_from_row(r)
 
     def create_ingredient(self, ing: Ingredient) -> bool:
-        return self._execute(
+        ok = self._execute(
             """
             INSERT INTO app.ingredient
             (id, name, calories, protein, carbs, fat, fiber,
@@ -351,6 +1123,8 @@ class DatabaseAdapter:
                 ing["soy_free"],
             ),
         )
+        self.invalidate_ingredient(ing["id"])
+        return ok
 
     def update_ingredient(self, ingredient_id: int, **fields: Any) -> bool:
         allowed = {
@@ -375,61 +1149,64 @@ class DatabaseAdapter:
         if not cols:
             return True
         vals.append(ingredient_id)
-        return self._execute(
+        ok = self._execute(
             f"UPDATE app.ingredient SET {', '.join(cols)} WHERE id = %s", tuple(vals)
         )
+        self.invalidate_ingredient(ingredient_id)
+        return ok
 
     def delete_ingredient(self, ingredient_id: int) -> bool:
-        return self._execute(
-            "DELETE FROM app.ingredient WHERE id = %s", (ingredient_id,)
+        ok = self._execute(
+            "DELETE FROM app.ingredient WHERE id = %s", (ingredient_id,), prepare=True
         )
+        self.invalidate_ingredient(ingredient_id)
+        return ok
 
     # --- Menus -------------------------------------------------------------
 
     def get_menu(self, menu_id: int) -> Optional[Menu]:
-        row = self._query_one(
-            """
-            SELECT id, name, description, type, cooking_time, recipe
-            FROM app.menu
-            WHERE id = %s
-            """,
-            (menu_id,),
-        )
+        cached = self._cache_get(("menu", menu_id))
+        if cached is not None:
+            return cast(Menu, cached)
+        row = self._query_one(SQL_GET_MENU, (menu_id,), prepare=True)
         if row is None:
             return None
-        recipe = cast(List[Dict[str, Any]], row[4] or [])
-        return {
-            "id": cast(int, row[0]),
-            "name": cast(str, row[1]),
-            "description": cast(Optional[str], row[2]) or "",
-            "type": cast(str, row[3]),
-            "cooking_time": cast(int, row[4]),
-            "recipe": recipe,
-        }
+        menu = menu_from_row(row)
+        self._cache_put(("menu", menu_id), menu)
+        return menu
 
-    def list_menus(self, limit: int = 100, offset: int = 0) -> List[Menu]:
+    def list_menus(
+        self, limit: Optional[int] = 100, offset: int = 0, meal_type: Optional[str] = None
+    ) -> List[Menu]:
+        cached = self._cache_get(("menus", limit, offset, meal_type))
+        if cached is not None:
+            return list(cast(List[Menu], cached))
+        rows = self._query(SQL_LIST_MENUS, (meal_type, meal_type, limit, offset), prepare=True)
+        out = [menu_from_row(r) for r in rows]
+        self._cache_put(("menus", limit, offset, meal_type), out)
+        return list(out)
+
+    def list_menus_after(
+        self, after_name: Optional[str], limit: int = 100, meal_type: Optional[str] = None
+    ) -> List[Menu]:
+        """Keyset page: up to `limit` menus sorting after `after_name` (None = first page)."""
+        if after_name is None:
+            return self.list_menus(limit=limit, offset=0, meal_type=meal_type)
         rows = self._query(
-            """
-            SELECT id, name, description, type, cooking_time, recipe
-            FROM app.menu
-            ORDER BY name
-            LIMIT %s OFFSET %s
-            """,
-            (limit, offset),
+            SQL_LIST_MENUS_AFTER, (meal_type, meal_type, after_name, limit), prepare=True
         )
-        out: List[Menu] = []
-        for r in rows:
-            out.append(
-                {
-                    "id": cast(int, r[0]),
-                    "name": cast(str, r[1]),
-                    "description": cast(Optional[str], r[2]) or "",
-                    "type": cast(str, r[3]),
-                    "cooking_time": cast(int, r[4]),
-                    "recipe": cast(List[Dict[str, Any]], r[5] or []),
-                }
-            )
-        return out
+        return [menu_from_row(r) for r in rows]
+
+    def stream_menus(
+        self,
+        limit: Optional[int] = None,
+        offset: int = 0,
+        meal_type: Optional[str] = None,
+        batch_size: int = 500,
+    ) -> Iterator[Menu]:
+        """Like `list_menus`, but lazily and in batches, bypassing the cache."""
+        for r in self._stream(SQL_LIST_MENUS, (meal_type, meal_type, limit, offset), batch_size):
+            yield menu_from_row(r)
 
     def create_menu(self, menu: Menu) -> Optional[int]:
         row = self._query_one(
@@ -445,7 +1222,10 @@ class DatabaseAdapter:
                 json.dumps(menu.get("recipe", [])),
             ),
         )
-        return cast(Optional[int], row[0] if row else None)
+        new_id = cast(Optional[int], row[0] if row else None)
+        if new_id is not None:
+            self.invalidate_menu(new_id)
+        return new_id
 
     def update_menu(self, menu_id: int, **fields: Any) -> bool:
         allowed = {"name", "description", "cooking_time", "recipe"}
@@ -460,68 +1240,93 @@ class DatabaseAdapter:
         if not cols:
             return True
         vals.append(menu_id)
-        return self._execute(
+        ok = self._execute(
             f"UPDATE app.menu SET {', '.join(cols)} WHERE id = %s", tuple(vals)
         )
+        self.invalidate_menu(menu_id)
+        return ok
 
     def delete_menu(self, menu_id: int) -> bool:
-        return self._execute("DELETE FROM app.menu WHERE id = %s", (menu_id,))
+        ok = self._execute("DELETE FROM app.menu WHERE id = %s", (menu_id,), prepare=True)
+        self.invalidate_menu(menu_id)
+        if ok:
+            self._update_menu_index(menu_id, {})
+        return ok
 
     def set_menu_ingredients(self, menu_id: int, items: List[Menu_Ingredient]) -> bool:
-        self._execute("DELETE FROM app.menu_ingredient WHERE menu_id = %s", (menu_id,))
-        for it in items:
-            self._execute(
-                """
-                INSERT INTO app.menu_ingredient(menu_id, ingredient_id, quantity)
-                VALUES (%s,%s,%s)
-                """,
-                (menu_id, it["ingredient_id"], it["quantity"]),
+        ok = self._replace_ingredient_rows("menu_ingredient", "menu_id", menu_id, items)
+        # Triggers recomputed the menu's diet_flags; nutrients changed as well
+        if self.cache is not None:
+            self.cache.invalidate_namespace(*MENU_AGGREGATES)
+        if ok:
+            # Same collapsing of duplicates as _replace_ingredient_rows
+            self._update_menu_index(
+                menu_id, {int(it["ingredient_id"]): float(it["quantity"]) for it in items}
             )
-        return True
+        return ok
+
+    def menu_ingredient_index(self) -> MenuIngredientIndex:
+        """The ingredient -> menus index, loaded with one query on first use."""
+        index = self._menu_index
+        if index is not None and time.monotonic() - index.built_at < self.menu_index_ttl:
+            return index
+        with self._menu_index_lock:
+            index = self._menu_index
+            if index is None or time.monotonic() - index.built_at >= self.menu_index_ttl:
+                rows = self._query(SQL_ALL_MENU_INGREDIENTS, (), prepare=True)
+                index = MenuIngredientIndex((int(r[0]), int(r[1]), float(r[2])) for r in rows)
+                if not self.in_transaction:
+                    self._menu_index = index
+            return index
+
+    def _update_menu_index(self, menu_id: int, quantities: Dict[int, float]) -> None:
+        index = self._menu_index
+        if index is None:
+            return
+        if self.in_transaction:
+            # The write may still be rolled back; reload on next use instead
+            self._menu_index = None
+        else:
+            index.set_menu(menu_id, quantities)
+
+    def get_menu_diet_flags(self) -> Dict[int, int]:
+        """menu id -> diet_flags bitmask for the whole catalog (see DIET_FLAGS)."""
+        cached = self._cache_get(("menu_diet_flags",))
+        if cached is not None:
+            return cast(Dict[int, int], cached)
+        rows = self._query("SELECT id, diet_flags FROM app.menu", (), prepare=True)
+        flags = {int(r[0]): int(r[1]) for r in rows}
+        self._cache_put(("menu_diet_flags",), flags)
+        return flags
+
+    def get_menu_nutrients(self) -> Dict[int, Tuple[float, ...]]:
+        """
+        menu id -> per-serving totals in NUTRIENTS order (sum of quantity x
+        per-unit value over the menu's ingredients). Menus without
+        ingredients are missing. The returned mapping is shared while cached,
+        so callers can key derived data on its identity.
+        """
+        cached = self._cache_get(("menu_nutrients",))
+        if cached is not None:
+            return cast(Dict[int, Tuple[float, ...]], cached)
+        rows = self._query(SQL_MENU_NUTRIENTS, (), prepare=True)
+        nutrients = {int(r[0]): tuple(float(v) for v in r[1:]) for r in rows}
+        self._cache_put(("menu_nutrients",), nutrients)
+        return nutrients
 
     def get_menu_ingredients(self, menu_id: int) -> List[Menu_Ingredient]:
-        rows = self._query(
-            """
-            SELECT menu_id, ingredient_id, quantity
-            FROM app.menu_ingredient
-            WHERE menu_id = %s
-            ORDER BY ingredient_id
-            """,
-            (menu_id,),
-        )
-        return [
-            {
-                "menu_id": cast(int, r[0]),
-                "ingredient_id": cast(int, r[1]),
-                "quantity": float(r[2]),
-            }
-            for r in rows
-        ]
+        rows = self._query(SQL_MENU_INGREDIENTS, (menu_id,), prepare=True)
+        return [menu_ingredient_from_row(r) for r in rows]
 
     # --- Meals -------------------------------------------------------------
 
     def get_meal(self, meal_id: int) -> Optional[Meal]:
-        row = self._query_one(
-            """
-            SELECT id, user_id, date, type, name, description, people, menu_id
-            FROM app.meal
-            WHERE id = %s
-            """,
-            (meal_id,),
-        )
+        row = self._query_one(SQL_GET_MEAL, (meal_id,), prepare=True)
         if row is None:
             return None
-        return {
-            "id": cast(int, row[0]),
-            "user_id": cast(int, row[1]),
-            "date": cast(date, row[2]),
-            "type": cast(str, row[3]),
-            "name": cast(str, row[4]),
-            "description": cast(str, row[5]),
-            "people": cast(int, row[6]),
-            "menu_id": cast(int, row[7]),
-            "ingredients": None,
-        }
+        meal = meal_from_row(row)
+        meal["ingredients"] = None
+        return meal
 
     def list_meals_by_user(
     self,
@@ -529,110 +1334,50 @@ class DatabaseAdapter:
     date_from: Optional[date] = None,
     date_to: Optional[date] = None,
     ) -> List[Meal]:
-        clauses: List[str] = ["user_id = %s"]
-        params: List[Any] = [user_id]
-        if date_from is not None:
-            clauses.append("date >= %s")
-            params.append(date_from)
-        if date_to is not None:
-            clauses.append("date <= %s")
-            params.append(date_to)
-
-        # 1) Fetch meals
-        meal_rows = self._query(
-            f"""
-            SELECT id, user_id, date, type, name, description, people, menu_id
-            FROM app.meal
-            WHERE {" AND ".join(clauses)}
-            ORDER BY date, id
-            """,
-            tuple(params),
-        )
-
-        meals: List[Meal] = [
-            {
-                "id": cast(int, r[0]),
-                "user_id": cast(int, r[1]),
-                "date": cast(date, r[2]),
-                "type": cast(str, r[3]),
-                "name": cast(str, r[4]),
-                "description": cast(str, r[5]),
-                "people": cast(int, r[6]),
-                "menu_id": cast(int, r[7]) if r[7] is not None else 0,
-                # attach later; keep key consistent with rest of code
-                "ingredients": [],  # type: ignore[typeddict-item]
-            }
-            for r in meal_rows
-        ]
-
-        if not meals:
-            return meals
-
-        meal_ids = [m["id"] for m in meals]
-
-        # 2) Fetch ingredients for those meals (join to get ingredient details)
-        placeholders = ",".join(["%s"] * len(meal_ids))
-        ing_rows = self._query(
-            f"""
-            SELECT
-                mi.meal_id,
-                i.id,
-                i.name,
-                i.calories,
-                i.protein,
-                i.carbs,
-                i.fat,
-                i.fiber,
-                i.vegetarian,
-                i.vegan,
-                i.gluten_free,
-                i.lactose_free,
-                i.soy_free,
-                mi.quantity
-            FROM app.meal_ingredient AS mi
-            JOIN app.ingredient AS i
-            ON i.id = mi.ingredient_id
-            WHERE mi.meal_id IN ({placeholders})
-            ORDER BY mi.meal_id, i.id
-            """,
-            tuple(meal_ids),
-        )
-
-        # 3) Bucket ingredients by meal_id
-        by_meal: Dict[int, List[Dict[str, Ingredient | float]]] = {}
-        for r in ing_rows:
-            meal_id = int(r[0])
-            item: Dict[str, Ingredient | float] = {
-                "ingredient": {
-                    "id": int(r[1]),
-                    "name": cast(str, r[2]),
-                    "calories": float(r[3]),
-                    "protein": float(r[4]),
-                    "carbs": float(r[5]),
-                    "fat": float(r[6]),
-                    "fiber": float(r[7]),
-                    "vegetarian": cast(bool, r[8]),
-                    "vegan": cast(bool, r[9]),
-                    "gluten_free": cast(bool, r[10]),
-                    "lactose_free": cast(bool, r[11]),
-                    "soy_free": cast(bool, r[12]),
-                },
-                "quantity": float(r[13]),
-            }
-            by_meal.setdefault(meal_id, []).append(item)
-
-        # 4) Attach to meals
-        for m in meals:
-            m["ingredients"] = by_meal.get(m["id"], [])  # type: ignore[typeddict-item]
+        # One statement returns the meals with their ingredients. With the
+        # catalog cache only ingredient ids come back and the details are
+        # filled in from memory; otherwise Postgres nests full rows.
+        if self.cache is not None:
+            rows = self._query(
+                *meals_query(user_id, date_from, date_to, ingredients="links"), prepare=True
+            )
+            catalog = self.get_ingredients([i for r in rows for i in linked_ingredient_ids(r)])
+            by_row = [linked_ingredients(r, catalog) for r in rows]
+        else:
+            rows = self._query(*meals_query(user_id, date_from, date_to), prepare=True)
+            interned: Dict[int, Ingredient] = {}
+            by_row = [joined_ingredients(r, interned) for r in rows]
 
+        meals: List[Meal] = []
+        for r, ingredients in zip(rows, by_row):
+            meal = meal_from_row(r)
+            meal["menu_id"] = meal["menu_id"] or 0  # lists report a missing menu as 0
+            meal["ingredients"] = ingredients  # type: ignore[typeddict-item]
+            meals.append(meal)
         return meals
 
-    def create_meal(self, meal: Meal) -> Optional[int]:
+    def create_meal(self, meal: Meal, copy_menu_ingredients: bool = False) -> Optional[int]:
+        """
+        Insert one meal, optionally copying its menu's ingredient rows in the
+        same statement. Quantities stay per person, like the menu's;
+        consumers such as the shopping list scale by `people`.
+        """
         row = self._query_one(
             """
-            INSERT INTO app.meal(user_id, date, type, name, description, people, menu_id)
-            VALUES (%s,%s,%s,%s,%s,%s,%s)
-            RETURNING id
+            WITH inserted AS (
+                INSERT INTO app.meal(user_id, date, type, name, description, people, menu_id)
+                VALUES (%s,%s,%s,%s,%s,%s,%s)
+                RETURNING id, menu_id
+            ),
+            copied AS (
+                INSERT INTO app.meal_ingredient(meal_id, ingredient_id, quantity)
+                SELECT ins.id, mi.ingredient_id, mi.quantity
+                FROM inserted AS ins
+                JOIN app.menu_ingredient AS mi
+                  ON mi.menu_id = ins.menu_id
+                WHERE %s::boolean
+            )
+            SELECT id FROM inserted
             """,
             (
                 meal["user_id"],
@@ -642,10 +1387,63 @@ class DatabaseAdapter:
                 meal["description"],
                 meal["people"],
                 meal.get("menu_id"),
+                copy_menu_ingredients,
             ),
+            prepare=True,
         )
         return cast(Optional[int], row[0] if row else None)
 
+    def create_meals(
+        self, user_id: int, meals: Sequence[Meal], copy_menu_ingredients: bool = False
+    ) -> List[int]:
+        """
+        Insert a batch of meals for one user in a single statement (and
+        transaction), optionally copying each meal's ingredient rows from its
+        menu (per person, see `create_meal`). Returns the new ids in input
+        order.
+        """
+        if not meals:
+            return []
+        rows = self._query(
+            """
+            WITH incoming AS (
+                SELECT *
+                FROM unnest(
+                    %s::date[], %s::text[], %s::text[], %s::text[], %s::int[], %s::bigint[]
+                ) WITH ORDINALITY AS t(date, type, name, description, people, menu_id, ord)
+            ),
+            inserted AS (
+                INSERT INTO app.meal(user_id, date, type, name, description, people, menu_id)
+                SELECT %s::bigint, date, type, name, description, people, menu_id
+                FROM incoming
+                ORDER BY ord
+                RETURNING id, menu_id
+            ),
+            copied AS (
+                INSERT INTO app.meal_ingredient(meal_id, ingredient_id, quantity)
+                SELECT ins.id, mi.ingredient_id, mi.quantity
+                FROM inserted AS ins
+                JOIN app.menu_ingredient AS mi
+                  ON mi.menu_id = ins.menu_id
+                WHERE %s::boolean
+            )
+            SELECT id FROM inserted ORDER BY id
+            """,
+            (
+                [m["date"] for m in meals],
+                [m["type"] for m in meals],
+                [m["name"] for m in meals],
+                [m["description"] for m in meals],
+                [m["people"] for m in meals],
+                [m.get("menu_id") or None for m in meals],
+                user_id,
+                copy_menu_ingredients,
+            ),
+            prepare=True,
+        )
+        # ids come from a sequence in insertion order, which follows `ord`
+        return [int(r[0]) for r in rows]
+
     def update_meal(self, meal_id: int, **fields: Any) -> bool:
         allowed = {
             "user_id",
@@ -670,35 +1468,224 @@ class DatabaseAdapter:
         )
 
     def delete_meal(self, meal_id: int) -> bool:
-        return self._execute("DELETE FROM app.meal WHERE id = %s", (meal_id,))
+        return self._execute("DELETE FROM app.meal WHERE id = %s", (meal_id,), prepare=True)
 
     def set_meal_ingredients(self, meal_id: int, items: List[Meal_Ingredient]) -> bool:
-        self._execute("DELETE FROM app.meal_ingredient WHERE meal_id = %s", (meal_id,))
-        for it in items:
-            self._execute(
-                """
-                INSERT INTO app.meal_ingredient(meal_id, ingredient_id, quantity)
-                VALUES (%s,%s,%s)
-                """,
-                (meal_id, it["ingredient_id"], it["quantity"]),
-            )
-        return True
+        return self._replace_ingredient_rows("meal_ingredient", "meal_id", meal_id, items)
 
     def get_meal_ingredients(self, meal_id: int) -> List[Meal_Ingredient]:
-        rows = self._query(
-            """
-            SELECT meal_id, ingredient_id, quantity
-            FROM app.meal_ingredient
-            WHERE meal_id = %s
-            ORDER BY ingredient_id
-            """,
-            (meal_id,),
-        )
+        rows = self._query(SQL_MEAL_INGREDIENTS, (meal_id,), prepare=True)
+        return [meal_ingredient_from_row(r) for r in rows]
+
+    def cook_meal(self, meal_id: int) -> CookResult:
+        """
+        Mark one meal cooked and deduct its ingredients from the owner's
+        inventory. `cooked` is empty if the meal is missing or was already
+        cooked.
+        """
+        return self._cook(SQL_COOK_MEAL, (meal_id,))
+
+    def cook_meals(self, user_id: int, meal_date: date) -> CookResult:
+        """Same as `cook_meal` for every uncooked meal of the user on `meal_date`."""
+        return self._cook(SQL_COOK_MEALS_ON_DATE, (user_id, meal_date))
+
+    def _cook(self, query: str, params: Sequence[Any]) -> CookResult:
+        row = self._query_one(query, params, prepare=True)
+        meal_ids, ingredient_ids, quantities = row if row else ([], [], [])
+        return {
+            "cooked": [int(i) for i in meal_ids],
+            "inventory": {int(i): float(q) for i, q in zip(ingredient_ids, quantities)},
+        }
+
+    # --- Shopping list -----------------------------------------------------
+
+    def get_required_ingredients(
+        self, user_id: int, date_from: date, date_to: date
+    ) -> Dict[int, float]:
+        """Total quantity per ingredient for all meals in the range, scaled by `people`."""
+        rows = self._query(SQL_REQUIRED_INGREDIENTS, (user_id, date_from, date_to), prepare=True)
+        return {int(r[0]): float(r[1]) for r in rows}
+
+    def get_shopping_list(
+        self, user_id: int, date_from: date, date_to: date
+    ) -> List[Dict[str, Ingredient | float]]:
+        """
+        Required-minus-inventory for the range, with ingredient details, in
+        a single statement.
+        """
+        rows = self._query(SQL_SHOPPING_LIST, (user_id, date_from, date_to, user_id), prepare=True)
         return [
-            {
-                "meal_id": cast(int, r[0]),
-                "ingredient_id": cast(int, r[1]),
-                "quantity": float(r[2]),
-            }
+            {"ingredient": ingredient_from_row(r), "quantity": float(r[12])}
             for r in rows
         ]
+
+
+# --- row mappers ----------------------------------------------------------
+
+
+# One dict literal per row and no per-column calls beyond the conversions
+# spelled out; multi-week plans map thousands of rows per request.
+
+def ingredient_from_row(r: Sequence[Any]) -> Ingredient:
+    """The 12 INGREDIENT_COLUMNS; also used for the arrays of `joined` meal rows."""
+    return {
+        "id": int(r[0]),
+        "name": r[1],
+        "calories": float(r[2]),
+        "protein": float(r[3]),
+        "carbs": float(r[4]),
+        "fat": float(r[5]),
+        "fiber": float(r[6]),
+        "vegetarian": r[7],
+        "vegan": r[8],
+        "gluten_free": r[9],
+        "lactose_free": r[10],
+        "soy_free": r[11],
+    }
+
+
+def user_from_row(r: Row, inventory: Optional[Dict[str, float]]) -> User:
+    return {
+        "id": r[0],
+        "name": r[1],
+        "age": r[2],
+        "location": r[3],
+        "vegan": r[4],
+        "vegetarian": r[5],
+        "gluten_free": r[6],
+        "lactose_free": r[7],
+        "soy_free": r[8],
+        "inventory": inventory,
+    }
+
+
+def menu_from_row(r: Row) -> Menu:
+    return {
+        "id": r[0],
+        "name": r[1],
+        "description": r[2] or "",
+        "type": r[3],
+        "cooking_time": r[4],
+        "recipe": r[5] or [],
+    }
+
+
+def meal_from_row(r: Row) -> Meal:
+    # Ingredients are attached later, the key keeps the shape
+    return {
+        "id": r[0],
+        "user_id": r[1],
+        "date": r[2],
+        "type": r[3],
+        "name": r[4],
+        "description": r[5],
+        "people": r[6],
+        "menu_id": r[7],
+        "ingredients": [],
+    }
+
+
+def menu_ingredient_from_row(r: Row) -> Menu_Ingredient:
+    return {"menu_id": r[0], "ingredient_id": r[1], "quantity": float(r[2])}
+
+
+def meal_ingredient_from_row(r: Row) -> Meal_Ingredient:
+    return {"meal_id": r[0], "ingredient_id": r[1], "quantity": float(r[2])}
+
+
+def inventory_by_name(rows: Rows) -> Dict[str, float]:
+    return {item[0]: float(item[1]) for item in rows}
+
+
+# Ingredients of one meal, aggregated next to the meal row. `links` only
+# returns ids and quantities (details come from the catalog cache), `joined`
+# returns full ingredient rows as a JSON array.
+MEAL_INGREDIENTS_LATERAL = {
+    "links": """
+        SELECT array_agg(mi.ingredient_id ORDER BY mi.ingredient_id) AS ingredient_ids,
+               array_agg(mi.quantity ORDER BY mi.ingredient_id) AS quantities
+        FROM app.meal_ingredient AS mi
+        WHERE mi.meal_id = m.id
+    """,
+    "joined": """
+        SELECT json_agg(
+                   json_build_array(
+                       i.id, i.name, i.calories, i.protein, i.carbs, i.fat, i.fiber,
+                       i.vegetarian, i.vegan, i.gluten_free, i.lactose_free, i.soy_free,
+                       mi.quantity
+                   )
+                   ORDER BY i.id
+               ) AS ingredients
+        FROM app.meal_ingredient AS mi
+        JOIN app.ingredient AS i
+          ON i.id = mi.ingredient_id
+        WHERE mi.meal_id = m.id
+    """,
+}
+
+
+def meals_query(
+    user_id: int,
+    date_from: Optional[date],
+    date_to: Optional[date],
+    ingredients: str = "joined",
+) -> Tuple[str, Tuple[Any, ...]]:
+    """
+    Meals of a user together with their ingredients in one statement. Rows
+    are the 8 meal columns followed by (ingredient_ids, quantities) for
+    `ingredients="links"` or a JSON array of 12 ingredient columns plus the
+    quantity for `ingredients="joined"`. At most four statement texts exist
+    (one per combination of date bounds), so each is prepared once.
+    """
+    clauses: List[str] = ["m.user_id = %s"]
+    params: List[Any] = [user_id]
+    if date_from is not None:
+        clauses.append("m.date >= %s")
+        params.append(date_from)
+    if date_to is not None:
+        clauses.append("m.date <= %s")
+        params.append(date_to)
+    columns = "l.ingredient_ids, l.quantities" if ingredients == "links" else "l.ingredients"
+    return (
+        f"""
+        SELECT m.id, m.user_id, m.date, m.type, m.name, m.description, m.people, m.menu_id,
+               {columns}
+        FROM app.meal AS m
+        LEFT JOIN LATERAL ({MEAL_INGREDIENTS_LATERAL[ingredients]}) AS l ON true
+        WHERE {" AND ".join(clauses)}
+        ORDER BY m.date, m.id
+        """,
+        tuple(params),
+    )
+
+
+MealIngredients = List[Dict[str, Ingredient | float]]
+
+
+def linked_ingredient_ids(r: Row) -> List[int]:
+    return [int(i) for i in r[8] or ()]
+
+
+def linked_ingredients(r: Row, catalog: Dict[int, Ingredient]) -> MealIngredients:
+    """Ingredients of a `links` row, with details taken from `catalog`."""
+    out: MealIngredients = []
+    for ingredient_id, quantity in zip(r[8] or (), r[9] or ()):
+        ingredient = catalog.get(int(ingredient_id))
+        if ingredient is not None:
+            out.append({"ingredient": ingredient, "quantity": float(quantity)})
+    return out
+
+
+def joined_ingredients(r: Row, interned: Dict[int, Ingredient]) -> MealIngredients:
+    """
+    Ingredients of a `joined` row (json_agg comes back already decoded).
+    `interned` is shared across the rows of one response, so an ingredient
+    used by many meals is mapped once and referenced from each of them.
+    """
+    out: MealIngredients = []
+    for item in r[8] or ():
+        ingredient = interned.get(item[0])
+        if ingredient is None:
+            ingredient = interned[item[0]] = ingredient_from_row(item)
+        out.append({"ingredient": ingredient, "quantity": float(item[12])})
+    return out
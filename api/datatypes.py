@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from typing import TypedDict, Dict, Any, List, Optional
+from typing import TypedDict, Dict, Any, List, NotRequired, Optional
 from datetime import date
 
 # --- Database entities ---
@@ -65,11 +65,24 @@ class Menu_Ingredient(TypedDict):
     ingredient_id: int
     quantity: float
 
+class CacheStats(TypedDict):
+    hits: int
+    misses: int
+    evictions: int
+    invalidations: int
+    size: int
+    max_entries: int
+    ttl: float
+
 class ResponseMessage(TypedDict):
     data: Any
     status: str
     error: Optional[str]
 
+class CookResult(TypedDict):
+    cooked: List[int]             # ids of the meals marked cooked
+    inventory: Dict[int, float]   # new quantity of every deducted ingredient
+
 # --- API request bodies ---
 
 class UserCreate(TypedDict):
@@ -140,6 +153,7 @@ class MealCreate(TypedDict):
     description: str
     people: int
     menu_id: Optional[int]
+    copy_menu_ingredients: NotRequired[bool]  # defaults to true
 
 class MealUpdate(TypedDict, total=False):
     user_id: int
@@ -153,6 +167,11 @@ class MealUpdate(TypedDict, total=False):
 class InventoryUpsert(TypedDict):
     quantity: float
 
+class InventoryChange(TypedDict, total=False):
+    ingredient_id: int
+    quantity: float  # new absolute amount, 0 removes the item
+    delta: float     # or a change to the current amount (clamped at 0)
+
 class MenuIngredientsPayloadItem(TypedDict):
     ingredient_id: int
     quantity: float
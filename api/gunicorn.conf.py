@@ -0,0 +1,107 @@
+"""
+Production WSGI server settings:
+
+    gunicorn -c gunicorn.conf.py app:app
+
+Runs `create_app()` in several worker processes with a thread pool each, so
+one slow request (e.g. planning a week of meals) no longer blocks the others.
+Everything is configurable through the environment:
+
+    PORT                    listen port (4000)
+    PG_CONNECTION_BUDGET    Postgres connections all workers may hold together (80)
+    WEB_CONCURRENCY         worker processes (2 * CPUs + 1, capped by the budget)
+    GUNICORN_THREADS        threads per worker (4)
+    GUNICORN_TIMEOUT        seconds before a stuck worker is killed (60)
+    GUNICORN_GRACEFUL_TIMEOUT
+                            seconds workers get to finish in-flight requests
+                            on restart/shutdown (30)
+    GUNICORN_MAX_REQUESTS   recycle a worker after this many requests, 0 = never (0)
+    GUNICORN_PRELOAD        import the app once in the master before forking (0)
+
+Each worker opens its own connection pool after the fork, plus one LISTEN
+connection for the ETag versions unless ETAGS_ENABLED=0. In total:
+
+    connections = workers * (PGPOOL_MAX + listener)
+
+which must stay below Postgres's max_connections (100 by default; the
+default budget of 80 leaves room for psql, migrations and the benchmark).
+Unless set explicitly, workers are capped at budget // (threads + listener)
+and PGPOOL_MAX defaults to the thread count, lowered to fit the budget.
+Explicit settings that exceed the budget stop the server at startup rather
+than failing under load; raise PG_CONNECTION_BUDGET together with
+max_connections.
+
+Graceful restart: `kill -HUP <master>` starts fresh workers and lets the old
+ones drain (with GUNICORN_PRELOAD=0 this also reloads the code), `kill -TERM`
+drains and exits.
+"""
+
+from __future__ import annotations
+
+import multiprocessing
+import os
+import sys
+from typing import Any, Optional
+
+from database_adapter import DatabaseAdapter
+
+
+bind = f"0.0.0.0:{os.getenv('PORT', '4000')}"
+
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "4"))
+
+connection_budget = int(os.getenv("PG_CONNECTION_BUDGET", "80"))
+listener = 0 if os.getenv("ETAGS_ENABLED", "1") == "0" else 1
+workers = int(os.getenv(
+    "WEB_CONCURRENCY",
+    str(max(1, min(multiprocessing.cpu_count() * 2 + 1, connection_budget // (threads + listener)))),
+))
+
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "60"))
+graceful_timeout = int(os.getenv("GUNICORN_GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+
+max_requests = int(os.getenv("GUNICORN_MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+
+preload_app = os.getenv("GUNICORN_PRELOAD", "0") == "1"
+
+accesslog = "-"
+errorlog = "-"
+
+# One connection per thread if the budget allows; read by create_app()
+pool_max = int(os.getenv("PGPOOL_MAX", str(min(threads, connection_budget // workers - listener))))
+if pool_max < 1 or workers * (pool_max + listener) > connection_budget:
+    raise RuntimeError(
+        f"{workers} workers x ({max(pool_max, 1)} pooled + {listener} listener) connections "
+        f"exceed PG_CONNECTION_BUDGET={connection_budget}"
+    )
+os.environ["PGPOOL_MAX"] = str(pool_max)
+
+def _db() -> Optional[DatabaseAdapter]:
+    # Only if this process has already imported the app (always true with preload)
+    module = sys.modules.get("app")
+    flask_app = getattr(module, "app", None)
+    if flask_app is None:
+        return None
+    return flask_app.extensions.get("db")
+
+
+def pre_fork(server: Any, worker: Any) -> None:
+    # With preload the master ran the schema check; don't hand its sockets to children
+    db = _db()
+    if db is not None:
+        db.disconnect()
+
+
+def post_fork(server: Any, worker: Any) -> None:
+    db = _db()
+    if db is not None:
+        db.after_fork()
+
+
+def worker_exit(server: Any, worker: Any) -> None:
+    db = _db()
+    if db is not None:
+        db.disconnect()
@@ -0,0 +1,182 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from flask import Flask, Response, g, has_request_context, request
+
+from database_adapter import DatabaseAdapter
+
+
+# Latency buckets in seconds, statement-count buckets in statements
+SECONDS_BUCKETS: Tuple[float, ...] = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0,
+)
+COUNT_BUCKETS: Tuple[float, ...] = (1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class RequestStats:
+    """Database work done while serving a single request."""
+
+    __slots__ = ("statements", "db_seconds", "rows", "slowest_seconds", "slowest_sql")
+
+    def __init__(self) -> None:
+        self.statements: int = 0
+        self.db_seconds: float = 0.0
+        self.rows: int = 0
+        self.slowest_seconds: float = 0.0
+        self.slowest_sql: Optional[str] = None
+
+    def record(self, sql: str, seconds: float, rows: int) -> None:
+        self.statements += 1
+        self.db_seconds += seconds
+        self.rows += rows
+        if seconds >= self.slowest_seconds:
+            self.slowest_seconds = seconds
+            self.slowest_sql = sql
+
+
+class Histogram:
+    """Minimal Prometheus histogram with a single `route` label."""
+
+    def __init__(self, name: str, description: str, buckets: Sequence[float]) -> None:
+        self.name = name
+        self.description = description
+        self.buckets: Tuple[float, ...] = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        # route -> (cumulative bucket counts, sum, count)
+        self._series: Dict[str, Tuple[List[int], float, int]] = {}
+
+    def observe(self, route: str, value: float) -> None:
+        with self._lock:
+            counts, total, n = self._series.get(route) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._series[route] = (counts, total + value, n + 1)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.description}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for route, (counts, total, n) in sorted(self._series.items()):
+                label = f'route="{_escape(route)}"'
+                for bound, count in zip(self.buckets, counts):
+                    lines.append(f'{self.name}_bucket{{{label},le="{bound:g}"}} {count}')
+                lines.append(f'{self.name}_bucket{{{label},le="+Inf"}} {n}')
+                lines.append(f"{self.name}_sum{{{label}}} {total:.6f}")
+                lines.append(f"{self.name}_count{{{label}}} {n}")
+        return lines
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self.request_seconds = Histogram(
+            "sagdu_request_duration_seconds", "Time spent serving the request.", SECONDS_BUCKETS
+        )
+        self.db_seconds = Histogram(
+            "sagdu_request_db_seconds", "Time spent in database statements per request.", SECONDS_BUCKETS
+        )
+        self.statements = Histogram(
+            "sagdu_request_db_statements", "Database statements executed per request.", COUNT_BUCKETS
+        )
+
+    def observe(self, route: str, request_seconds: float, stats: RequestStats) -> None:
+        self.request_seconds.observe(route, request_seconds)
+        self.db_seconds.observe(route, stats.db_seconds)
+        self.statements.observe(route, stats.statements)
+
+    def render(self, db: DatabaseAdapter) -> str:
+        lines: List[str] = []
+        for histogram in (self.request_seconds, self.db_seconds, self.statements):
+            lines.extend(histogram.render())
+        cache = db.cache_stats()
+        if cache is not None:
+            for key in ("hits", "misses", "evictions", "invalidations"):
+                name = f"sagdu_catalog_cache_{key}_total"
+                lines.append(f"# TYPE {name} counter")
+                lines.append(f"{name} {cache[key]}")
+            lines.append("# TYPE sagdu_catalog_cache_size gauge")
+            lines.append(f"sagdu_catalog_cache_size {cache['size']}")
+        return "\n".join(lines) + "\n"
+
+
+def install(
+    app: Flask,
+    db: DatabaseAdapter,
+    metrics_enabled: bool = False,
+    slow_query_ms: Optional[float] = None,
+) -> Optional[Metrics]:
+    """
+    Record every statement the adapter runs against the current request,
+    report it in a `Server-Timing` header (not on streamed responses, whose
+    queries run after the headers are sent) and, if enabled, aggregate it
+    per route on `GET /metrics` (Prometheus text format).
+    """
+    metrics = Metrics() if metrics_enabled else None
+
+    def on_query(sql: str, seconds: float, rows: int) -> None:
+        if not has_request_context():
+            return
+        stats: Optional[RequestStats] = g.get("query_stats")
+        if stats is not None:
+            stats.record(sql, seconds, rows)
+
+    db.on_query = on_query
+
+    @app.before_request
+    def start_request_stats() -> None:
+        g.query_stats = RequestStats()
+        g.request_started = time.perf_counter()
+
+    def finish(stats: RequestStats, elapsed: float, method: str, path: str, route: str) -> None:
+        if (
+            slow_query_ms is not None
+            and stats.slowest_sql is not None
+            and stats.slowest_seconds * 1000 >= slow_query_ms
+        ):
+            print(
+                f"Slow query on {method} {path} "
+                f"({stats.slowest_seconds * 1000:.1f} ms): {_one_line(stats.slowest_sql)}"
+            )
+        if metrics is not None:
+            metrics.observe(route, elapsed, stats)
+
+    @app.after_request
+    def report_request_stats(response: Response) -> Response:
+        stats: Optional[RequestStats] = g.get("query_stats")
+        started: Optional[float] = g.get("request_started")
+        if stats is None or started is None:
+            return response
+        method, path = request.method, request.path
+        route = request.url_rule.rule if request.url_rule is not None else "<unmatched>"
+        if response.is_streamed:
+            # The body (and its queries) is produced after this hook, so no
+            # Server-Timing header; log and aggregate once the stream closed.
+            response.call_on_close(
+                lambda: finish(stats, time.perf_counter() - started, method, path, route)
+            )
+            return response
+        elapsed = time.perf_counter() - started
+        response.headers["Server-Timing"] = (
+            f'db;dur={stats.db_seconds * 1000:.2f};desc="{stats.statements} statements, {stats.rows} rows", '
+            f"db-slowest;dur={stats.slowest_seconds * 1000:.2f}, "
+            f"app;dur={elapsed * 1000:.2f}"
+        )
+        finish(stats, elapsed, method, path, route)
+        return response
+
+    if metrics is not None:
+        @app.get("/metrics")
+        def metrics_endpoint() -> Response:
+            return Response(metrics.render(db), mimetype="text/plain; version=0.0.4")
+
+    return metrics
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _one_line(sql: str) -> str:
+    return " ".join(sql.split())
@@ -1,12 +1,19 @@
-from database_adapter import DatabaseAdapter
-from datatypes import User, ResponseMessage, Meal, Menu, Ingredient, Meal_Ingredient
+from database_adapter import DatabaseAdapter, diet_mask
+from datatypes import User, ResponseMessage, Meal, Menu
 from datetime import date, timedelta
-from typing import List, Dict
+from typing import List, Dict, Mapping, Optional
+from planner import NutritionPlanner, PantryPlanner
 import random
 
+MEAL_TYPES = ("breakfast", "lunch", "dinner")
+MAX_PLAN_DAYS = 28
+PLAN_MODES = ("nutrition", "pantry", "random")
+
 class MealManager:
-    def __init__(self, db: DatabaseAdapter):
+    def __init__(self, db: DatabaseAdapter, planner: Optional[NutritionPlanner] = None):
         self.db = db
+        self.planner = planner
+        self.pantry_planner = PantryPlanner(db)
     
     def get_user(self, id: int) -> ResponseMessage:
         response: User | Exception | None = self.db.get_user(id)
@@ -17,85 +24,158 @@ class MealManager:
             return {"data": None, "status": "not_found", "error": "User not found"}
         return {"data": response, "status": "success", "error": None}
     
-    def get_meals_of_user(self, user_id: int) -> ResponseMessage:
+    def get_meals_of_user(self, user_id: int, days: int = 7) -> ResponseMessage:
         date_from: date = date.today()
-        date_to: date = date.today() + timedelta(days=7)
+        date_to: date = date.today() + timedelta(days=days)
         meals: List[Meal] = self.db.list_meals_by_user(user_id, date_from, date_to)
         return {"data": meals, "status": "success", "error": None}
     
-    def create_meals(self, user_id: int) -> ResponseMessage:
-        meals: List[Meal] = self.get_meals_of_user(user_id)["data"]
-        for day in range(7):
-            meal_date = date.today() + timedelta(days=day)
-            meals_on_date = [m for m in meals if m["date"] == meal_date]
-            if not any(m["type"] == "breakfast" for m in meals_on_date):
-                meals.append(self.create_meal_type(user_id, "breakfast", meal_date))
-            if not any(m["type"] == "lunch" for m in meals_on_date):
-                meals.append(self.create_meal_type(user_id, "lunch", meal_date))
-            if not any(m["type"] == "dinner" for m in meals_on_date):
-                meals.append(self.create_meal_type(user_id, "dinner", meal_date))
+    def create_meals(
+        self,
+        user_id: int,
+        days: int = 7,
+        targets: Optional[Mapping[str, float]] = None,
+        mode: Optional[str] = None,
+    ) -> ResponseMessage:
+        """
+        Plan the open slots of the next `days` days. `mode` is "nutrition"
+        (closest to the nutrient targets, the default when a planner is
+        configured), "pantry" (use up the user's inventory) or "random".
+        """
+        if days < 1 or days > MAX_PLAN_DAYS:
+            return {"data": None, "status": "error", "error": f"days must be between 1 and {MAX_PLAN_DAYS}"}
+        if mode is None:
+            mode = "nutrition" if self.planner is not None else "random"
+        if mode not in PLAN_MODES:
+            return {"data": None, "status": "error", "error": f"mode must be one of {', '.join(PLAN_MODES)}"}
+        user = self.db.get_user(user_id)
+        if user is None:
+            return {"data": None, "status": "not_found", "error": "User not found"}
+        meals: List[Meal] = self.get_meals_of_user(user_id, days)["data"]
+        # Load the catalog once and index it, instead of once per empty slot
+        menus_by_type = self.index_menus_by_type(self.eligible_menus(user))
+        if not any(menus_by_type.values()):
+            return {"data": None, "status": "error", "error": "No menus match the user's preferences"}
+
+        planned = {(m["date"], m["type"]) for m in meals}
+        slots = [
+            (date.today() + timedelta(days=day), meal_type)
+            for day in range(days)
+            for meal_type in MEAL_TYPES
+            if (date.today() + timedelta(days=day), meal_type) not in planned
+        ]
+        if mode == "pantry":
+            inventory = self.db.get_user_inventory(user_id)
+            chosen = self.pantry_planner.plan(slots, menus_by_type, inventory, meals)
+        elif mode == "nutrition" and self.planner is not None:
+            # Existing meals count towards their day's nutrients and against repeats
+            chosen = self.planner.plan(slots, menus_by_type, meals, targets)
+        else:
+            for meal_date, meal_type in slots:
+                meals.append(self.create_meal_type(user_id, meal_type, meal_date, menus_by_type))
+            return {"data": meals, "status": "success", "error": None}
+        for meal_date, meal_type in slots:
+            meals.append(self.meal_from_menu(user_id, meal_type, meal_date, chosen[(meal_date, meal_type)]))
         return {"data": meals, "status": "success", "error": None}
 
-    def create_meal_type(self, user_id: int, meal_type: str, meal_date: date) -> Meal:
-        menus: List[Menu] = self.db.list_menus()
-        filtered_menus = [m for m in menus if meal_type in "".join(m["type"]).lower()]
-        # TODO: filter by user preferences
-        random_menu: Menu = random.choice(filtered_menus) if filtered_menus else random.choice(menus)
+    def eligible_menus(self, user: User) -> List[Menu]:
+        """
+        Menus whose every ingredient satisfies the user's dietary flags. Uses
+        the precomputed menu bitmasks, so no ingredients are loaded.
+        """
+        menus = self.db.list_menus(limit=None)
+        required = diet_mask(user)
+        if not required:
+            return menus
+        flags = self.db.get_menu_diet_flags()
+        return [m for m in menus if flags.get(m["id"], 0) & required == required]
+
+    @staticmethod
+    def index_menus_by_type(menus: List[Menu]) -> Dict[str, List[Menu]]:
+        """
+        Bucket menus by meal type. Types without a matching menu fall back to
+        the whole catalog.
+        """
+        index: Dict[str, List[Menu]] = {t: [] for t in MEAL_TYPES}
+        for menu in menus:
+            menu_types = "".join(menu["type"]).lower()
+            for meal_type in MEAL_TYPES:
+                if meal_type in menu_types:
+                    index[meal_type].append(menu)
+        for meal_type in MEAL_TYPES:
+            if not index[meal_type]:
+                index[meal_type] = menus
+        return index
+
+    def create_meal_type(
+        self,
+        user_id: int,
+        meal_type: str,
+        meal_date: date,
+        menus_by_type: Optional[Dict[str, List[Menu]]] = None,
+    ) -> Meal:
+        if menus_by_type is None:
+            user = self.db.get_user(user_id)
+            if user is None:
+                raise ValueError(f"User {user_id} not found")
+            menus_by_type = self.index_menus_by_type(self.eligible_menus(user))
+        if not menus_by_type[meal_type]:
+            raise ValueError("No menus match the user's preferences")
+        random_menu: Menu = random.choice(menus_by_type[meal_type])
+        return self.meal_from_menu(user_id, meal_type, meal_date, random_menu)
+
+    @staticmethod
+    def meal_from_menu(user_id: int, meal_type: str, meal_date: date, menu: Menu) -> Meal:
         meal: Meal = {
             "id": 0,
             "user_id": user_id,
             "date": meal_date,
             "type": meal_type,
-            "name": random_menu["name"],
-            "description": random_menu["description"],
+            "name": menu["name"],
+            "description": menu["description"],
             "people": 1,
-            "menu_id": random_menu["id"],
+            "menu_id": menu["id"],
             "ingredients": None,
         }
         return meal
     
-    def safe_meals(self, meals: List[Meal]) -> ResponseMessage:
+    def safe_meals(
+        self, user_id: int, meals: List[Meal], copy_menu_ingredients: bool = True
+    ) -> ResponseMessage:
         meals = [meal for meal in meals if meal["id"] == 0]
-        for meal in meals:
-            meal_id = self.db.create_meal(meal)
-            if meal_id is None:
-                return {"data": None, "status": "error", "error": "Failed to create meal"}
+        # Meals from a JSON body carry ISO strings. A prepared statement
+        # sends them as text[], which Postgres won't cast to date[].
+        try:
+            for meal in meals:
+                if isinstance(meal["date"], str):
+                    meal["date"] = date.fromisoformat(meal["date"])
+        except ValueError as e:
+            return {"data": None, "status": "error", "error": f"Invalid meal date: {e}"}
+        try:
+            meal_ids = self.db.create_meals(user_id, meals, copy_menu_ingredients)
+        except Exception as e:
+            print(f"safe_meals error: {e}")
+            return {"data": None, "status": "error", "error": "Failed to create meals"}
+        for meal, meal_id in zip(meals, meal_ids):
             meal["id"] = meal_id
+            meal["user_id"] = user_id
         return {"data": {}, "status": "success", "error": None}
     
-    def get_shopping_list(self, user_id: int) -> ResponseMessage:
-        date_from: date = date.today()
-        date_to: date = date.today() + timedelta(days=7)
-        inventory = self.db.get_user_inventory(user_id)
-        required_ingredients = self.get_required_ingredients(user_id, date_from, date_to)
-
-        missing_ingredients: Dict[int, float] = {}
-        for ingredient_id, required_qty in required_ingredients.items():
-            current_qty = inventory.get(ingredient_id, 0.0)
-            if required_qty > current_qty:
-                missing_ingredients[ingredient_id] = required_qty - current_qty
-        
-        shopping_list: List[Dict[str, Ingredient | float]] = []
-        for ingredient_id, qty in missing_ingredients.items():
-            ingredient = self.db.get_ingredient(ingredient_id)
-            if ingredient is None:
-                continue
-            shopping_list.append({"ingredient": ingredient, "quantity": qty})
-
+    def get_shopping_list(
+        self,
+        user_id: int,
+        date_from: Optional[date] = None,
+        date_to: Optional[date] = None,
+    ) -> ResponseMessage:
+        date_from = date_from or date.today()
+        date_to = date_to or date_from + timedelta(days=7)
+        if date_to < date_from:
+            return {"data": None, "status": "error", "error": "date_to is before date_from"}
+        shopping_list = self.db.get_shopping_list(user_id, date_from, date_to)
         return {"data": shopping_list, "status": "success", "error": None}
 
     def get_required_ingredients(self, user_id: int, date_from: date, date_to: date) -> Dict[int, float]:
-        meals: List[Meal] = self.db.list_meals_by_user(user_id, date_from, date_to)
-        all_meal_ingredients: List[Meal_Ingredient] = []
-        for meal in meals:
-            all_meal_ingredients.extend(self.db.get_meal_ingredients(meal["id"]))
-        required_ingredients: Dict[int, float] = {}
-        for meal_ingredient in all_meal_ingredients:
-            if meal_ingredient["ingredient_id"] in required_ingredients:
-                required_ingredients[meal_ingredient["ingredient_id"]] += meal_ingredient["quantity"]
-            else:
-                required_ingredients[meal_ingredient["ingredient_id"]] = meal_ingredient["quantity"]
-        return required_ingredients
+        return self.db.get_required_ingredients(user_id, date_from, date_to)
 
 def main():
     db_adapter = DatabaseAdapter(
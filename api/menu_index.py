@@ -0,0 +1,87 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Dict, Iterable, Mapping, Tuple
+
+
+class MenuIngredientIndex:
+    """
+    In-memory copy of app.menu_ingredient, inverted: ingredient id -> the
+    menus that use it with their per-person quantity. Lets the pantry
+    planner score every menu against an inventory by walking only the
+    postings of the ingredients the user owns.
+
+    Built once from the whole table by the adapter and kept up to date by
+    `DatabaseAdapter.set_menu_ingredients`/`delete_menu`. Writes from other
+    processes are picked up when the adapter rebuilds it after `max_age`.
+    """
+
+    def __init__(self, rows: Iterable[Tuple[int, int, float]] = ()) -> None:
+        self.built_at: float = time.monotonic()
+        self._lock = threading.Lock()
+        # ingredient id -> {menu id: quantity}
+        self._postings: Dict[int, Dict[int, float]] = {}
+        # menu id -> {ingredient id: quantity}, to undo a menu's postings
+        self._menus: Dict[int, Dict[int, float]] = {}
+        for menu_id, ingredient_id, quantity in rows:
+            self._menus.setdefault(menu_id, {})[ingredient_id] = quantity
+            self._postings.setdefault(ingredient_id, {})[menu_id] = quantity
+
+    def set_menu(self, menu_id: int, quantities: Mapping[int, float]) -> None:
+        """Replace the ingredient list of one menu."""
+        with self._lock:
+            self._drop(menu_id)
+            if quantities:
+                self._menus[menu_id] = dict(quantities)
+                for ingredient_id, quantity in quantities.items():
+                    self._postings.setdefault(ingredient_id, {})[menu_id] = quantity
+
+    def remove_menu(self, menu_id: int) -> None:
+        with self._lock:
+            self._drop(menu_id)
+
+    def _drop(self, menu_id: int) -> None:
+        for ingredient_id in self._menus.pop(menu_id, {}):
+            postings = self._postings.get(ingredient_id)
+            if postings is not None:
+                postings.pop(menu_id, None)
+                if not postings:
+                    del self._postings[ingredient_id]
+
+    def ingredients(self, menu_id: int) -> Dict[int, float]:
+        """ingredient id -> per-person quantity of one menu (a copy)."""
+        with self._lock:
+            return dict(self._menus.get(menu_id, {}))
+
+    def postings(self, ingredient_id: int) -> Dict[int, float]:
+        """menu id -> per-person quantity of every menu using the ingredient (a copy)."""
+        with self._lock:
+            return dict(self._postings.get(ingredient_id, {}))
+
+    def ingredient_counts(self) -> Dict[int, int]:
+        """menu id -> number of ingredients; menus without ingredients are missing."""
+        with self._lock:
+            return {menu_id: len(items) for menu_id, items in self._menus.items()}
+
+    def coverage(self, inventory: Mapping[int, float], people: int = 1) -> Dict[int, float]:
+        """
+        menu id -> how many of the menu's ingredients `inventory` covers,
+        counting a partly stocked ingredient by the fraction on hand. Only
+        menus sharing at least one ingredient with the inventory appear.
+        """
+        covered: Dict[int, float] = {}
+        with self._lock:
+            for ingredient_id, stock in inventory.items():
+                if stock <= 0:
+                    continue
+                for menu_id, quantity in self._postings.get(ingredient_id, {}).items():
+                    covered[menu_id] = covered.get(menu_id, 0.0) + share(stock, quantity * people)
+        return covered
+
+
+def share(stock: float, required: float) -> float:
+    """Fraction of `required` that `stock` covers, in [0, 1]."""
+    if required <= 0:
+        return 1.0
+    return min(1.0, max(stock, 0.0) / required)
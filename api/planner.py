@@ -0,0 +1,285 @@
+from __future__ import annotations
+
+import random
+import threading
+import time
+from datetime import date
+from typing import Dict, List, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+from database_adapter import NUTRIENTS, DatabaseAdapter
+from datatypes import Meal, Menu
+from menu_index import share
+
+
+# Daily values for an adult (per person), used for nutrients without a target
+DEFAULT_DAILY_TARGETS: Dict[str, float] = {
+    "calories": 2000.0,
+    "protein": 50.0,
+    "carbs": 275.0,
+    "fat": 78.0,
+    "fiber": 28.0,
+}
+
+# Cost of using a menu once more anywhere in the plan, and on the same day,
+# relative to a day that misses every target by 100%.
+REPEAT_PENALTY = 0.5
+SAME_DAY_PENALTY = 5.0
+
+Slot = Tuple[date, str]
+
+
+class MenuMatrix:
+    """Menu x nutrient matrix (per serving) over the menus that have ingredients."""
+
+    def __init__(self, nutrients: Mapping[int, Tuple[float, ...]]) -> None:
+        self.menu_ids: List[int] = list(nutrients)
+        self.row_of: Dict[int, int] = {menu_id: i for i, menu_id in enumerate(self.menu_ids)}
+        self.values = np.zeros((len(self.menu_ids), len(NUTRIENTS)))
+        for i, menu_id in enumerate(self.menu_ids):
+            self.values[i] = nutrients[menu_id]
+
+    def nutrients(self, menu_id: Optional[int]) -> np.ndarray:
+        row = self.row_of.get(menu_id or 0)
+        return self.values[row] if row is not None else np.zeros(len(NUTRIENTS))
+
+
+class NutritionPlanner:
+    """
+    Fills open (date, meal type) slots with menus so that each day's
+    nutrient totals come close to the targets, preferring menus that are not
+    used elsewhere in the plan.
+
+    Local search over the slots: every move evaluates all candidates of a
+    slot at once on the NumPy matrix; restarts from random plans continue
+    until `time_budget` seconds are used, and the best plan wins.
+    """
+
+    def __init__(
+        self,
+        db: DatabaseAdapter,
+        time_budget: float = 0.2,
+        max_restarts: int = 20,
+        seed: Optional[int] = None,
+    ) -> None:
+        self.db = db
+        self.time_budget = time_budget
+        self.max_restarts = max_restarts
+        self._rng = np.random.default_rng(seed)
+        self._lock = threading.Lock()
+        self._source: Optional[Mapping[int, Tuple[float, ...]]] = None
+        self._matrix: Optional[MenuMatrix] = None
+
+    def matrix(self) -> MenuMatrix:
+        """The menu matrix, rebuilt only when the adapter hands out new nutrient data."""
+        nutrients = self.db.get_menu_nutrients()
+        with self._lock:
+            if self._matrix is None or nutrients is not self._source:
+                self._matrix = MenuMatrix(nutrients)
+                self._source = nutrients
+            return self._matrix
+
+    @staticmethod
+    def meal_nutrients(meal: Meal, matrix: MenuMatrix) -> np.ndarray:
+        """Per-person totals of an existing meal: its own ingredients, else its menu's."""
+        ingredients = meal.get("ingredients") or []
+        if not ingredients:
+            return matrix.nutrients(meal.get("menu_id"))
+        totals = np.zeros(len(NUTRIENTS))
+        for item in ingredients:
+            ingredient = item["ingredient"]
+            quantity = float(item["quantity"])  # type: ignore[arg-type]
+            totals += quantity * np.array([ingredient[n] for n in NUTRIENTS])  # type: ignore[index]
+        return totals
+
+    def plan(
+        self,
+        slots: Sequence[Slot],
+        candidates: Mapping[str, Sequence[Menu]],
+        existing: Sequence[Meal] = (),
+        targets: Optional[Mapping[str, float]] = None,
+    ) -> Dict[Slot, Menu]:
+        """
+        Choose a menu for every slot from `candidates[meal_type]`. `existing`
+        meals stay as they are but count towards their day's totals and
+        towards repeats.
+        """
+        if not slots:
+            return {}
+        started = time.perf_counter()
+        matrix = self.matrix()
+        with self._lock:
+            # Generators are not thread-safe; give each call its own
+            rng = np.random.default_rng(self._rng.integers(2**63))
+        targets = targets or {}
+        goal = np.array([
+            float(targets[n]) if targets.get(n) is not None else DEFAULT_DAILY_TARGETS[n]
+            for n in NUTRIENTS
+        ])
+        # Errors relative to the goal; a goal of 0 is measured against the daily value
+        scale = np.where(goal > 0, goal, [DEFAULT_DAILY_TARGETS[n] for n in NUTRIENTS])
+
+        # Local rows: the matrix's menus, then zero rows for menus without
+        # ingredients, so every menu is counted separately for repeats
+        row_of: Dict[int, int] = dict(matrix.row_of)
+
+        def row(menu_id: int) -> int:
+            if menu_id not in row_of:
+                row_of[menu_id] = len(row_of)
+            return row_of[menu_id]
+
+        slot_rows: List[np.ndarray] = []
+        slot_menus: List[Dict[int, Menu]] = []
+        for _, meal_type in slots:
+            by_row = {row(m["id"]): m for m in candidates[meal_type]}
+            if not by_row:
+                raise ValueError(f"No menus available for {meal_type}")
+            slot_rows.append(np.fromiter(by_row, dtype=np.intp))
+            slot_menus.append(by_row)
+        existing_rows = [row(m["menu_id"]) if m.get("menu_id") else None for m in existing]
+
+        values = np.zeros((len(row_of), len(NUTRIENTS)))
+        values[: len(matrix.menu_ids)] = matrix.values
+
+        days = sorted({d for d, _ in slots} | {m["date"] for m in existing})
+        day_of = {d: i for i, d in enumerate(days)}
+        slot_day = np.array([day_of[d] for d, _ in slots])
+        fixed = np.zeros((len(days), len(NUTRIENTS)))
+        fixed_counts = np.zeros(len(values))
+        fixed_day_counts = np.zeros((len(days), len(values)))
+        for meal, meal_row in zip(existing, existing_rows):
+            d = day_of[meal["date"]]
+            fixed[d] += self.meal_nutrients(meal, matrix)
+            if meal_row is not None:
+                fixed_counts[meal_row] += 1
+                fixed_day_counts[d, meal_row] += 1
+
+        def day_cost(totals: np.ndarray) -> np.ndarray:
+            return (((totals - goal) / scale) ** 2).sum(axis=-1)
+
+        best_choice: Optional[np.ndarray] = None
+        best_cost = np.inf
+        for _ in range(self.max_restarts):
+            choice = np.array([rng.choice(rows) for rows in slot_rows])
+            totals = fixed.copy()
+            np.add.at(totals, slot_day, values[choice])
+            counts = fixed_counts.copy()
+            np.add.at(counts, choice, 1)
+            day_counts = fixed_day_counts.copy()
+            np.add.at(day_counts, (slot_day, choice), 1)
+
+            improved = True
+            while improved and time.perf_counter() - started < self.time_budget:
+                improved = False
+                for s in rng.permutation(len(slots)):
+                    d, current, rows = slot_day[s], choice[s], slot_rows[s]
+                    base = totals[d] - values[current]
+                    # Other uses of each candidate once this slot is emptied
+                    is_current = rows == current
+                    others = counts[rows] - is_current
+                    same_day = day_counts[d, rows] - is_current
+                    cost = (
+                        day_cost(base + values[rows])
+                        + REPEAT_PENALTY * others
+                        + SAME_DAY_PENALTY * same_day
+                    )
+                    best = int(np.argmin(cost))
+                    pick = rows[best]
+                    if pick != current and cost[best] < cost[is_current][0] - 1e-12:
+                        totals[d] = base + values[pick]
+                        counts[current] -= 1
+                        counts[pick] += 1
+                        day_counts[d, current] -= 1
+                        day_counts[d, pick] += 1
+                        choice[s] = pick
+                        improved = True
+
+            cost = (
+                day_cost(totals).sum()
+                + REPEAT_PENALTY * np.maximum(counts - 1, 0).sum()
+                + SAME_DAY_PENALTY * np.maximum(day_counts - 1, 0).sum()
+            )
+            if cost < best_cost:
+                best_cost, best_choice = cost, choice.copy()
+            if time.perf_counter() - started >= self.time_budget:
+                break
+
+        assert best_choice is not None
+        return {slot: slot_menus[s][int(best_choice[s])] for s, slot in enumerate(slots)}
+
+
+class PantryPlanner:
+    """
+    Fills open slots with the menus the user's inventory covers best, so
+    planned meals use up what is already at home and the shopping list gets
+    shorter. A menu's score is the share of its ingredients in stock.
+
+    Scores come from the adapter's ingredient -> menus index: one pass over
+    the postings of the owned ingredients, then, as each pick takes its
+    ingredients out of the working stock, only the menus sharing those
+    ingredients are rescored.
+    """
+
+    def __init__(self, db: DatabaseAdapter) -> None:
+        self.db = db
+
+    def plan(
+        self,
+        slots: Sequence[Slot],
+        candidates: Mapping[str, Sequence[Menu]],
+        inventory: Mapping[int, float],
+        existing: Sequence[Meal] = (),
+        people: int = 1,
+    ) -> Dict[Slot, Menu]:
+        """
+        Choose a menu for every slot from `candidates[meal_type]`, in slot
+        order. Stock already claimed by `existing` meals is not counted, and
+        menus are not repeated while unused candidates remain.
+        """
+        index = self.db.menu_ingredient_index()
+        stock: Dict[int, float] = dict(inventory)
+        used = set()
+        for meal in existing:
+            items = meal.get("ingredients") or []
+            if items:
+                needs = {int(it["ingredient"]["id"]): float(it["quantity"]) for it in items}  # type: ignore[index,arg-type]
+            else:
+                needs = index.ingredients(meal.get("menu_id") or 0)
+            for ingredient_id, quantity in needs.items():
+                if ingredient_id in stock:
+                    stock[ingredient_id] = max(stock[ingredient_id] - quantity * meal["people"], 0.0)
+            if meal.get("menu_id"):
+                used.add(meal["menu_id"])
+
+        sizes = index.ingredient_counts()
+        covered = index.coverage(stock, people)
+        chosen: Dict[Slot, Menu] = {}
+        for slot in slots:
+            options = [m for m in candidates[slot[1]] if m["id"] not in used] or list(candidates[slot[1]])
+            if not options:
+                raise ValueError(f"No menus available for {slot[1]}")
+            # Share of the menu in stock first, then the absolute amount
+            scores = [
+                (covered.get(m["id"], 0.0) / sizes[m["id"]], covered.get(m["id"], 0.0))
+                if sizes.get(m["id"]) else (0.0, 0.0)
+                for m in options
+            ]
+            best = max(scores)
+            menu = random.choice([m for m, score in zip(options, scores) if score == best])
+            chosen[slot] = menu
+            used.add(menu["id"])
+
+            for ingredient_id, quantity in index.ingredients(menu["id"]).items():
+                before = stock.get(ingredient_id, 0.0)
+                if before <= 0:
+                    continue
+                after = max(before - quantity * people, 0.0)
+                stock[ingredient_id] = after
+                for menu_id, q in index.postings(ingredient_id).items():
+                    # Every menu using a stocked ingredient was scored up
+                    # front; one missing was added to the index since, by
+                    # another request, and keeps its score of 0.
+                    if menu_id in covered:
+                        covered[menu_id] += share(after, q * people) - share(before, q * people)
+        return chosen
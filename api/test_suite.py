@@ -1,18 +1,151 @@
 from __future__ import annotations
 
+import inspect
+import json
 import os
-from typing import List
-from datetime import date
+import sys
+import time
+from typing import Any, Dict, List
+from datetime import date, timedelta
 
+from async_database_adapter import SYNC_ONLY, AsyncDatabaseAdapter
+from catalog_cache import CatalogCache
 from database_adapter import DatabaseAdapter
 from datatypes import User, Ingredient, Menu, Meal, Menu_Ingredient, Meal_Ingredient
+from meal_manager import MealManager
+from menu_index import MenuIngredientIndex
+from planner import NutritionPlanner, PantryPlanner
 
 TEST_USER_ID = 424242
 ING1_ID = 91001
 ING2_ID = 91002
 TEST_MENU_NAME = "Test Menu CRUD"
 
+def close(a: float, b: float) -> bool:
+    return abs(a - b) < 1e-6
+
+# -------- pure-Python checks (no database) --------
+
+def check_catalog_cache() -> None:
+    print("CatalogCache TTL/LRU…")
+    now = [0.0]
+    cache = CatalogCache(max_entries=2, ttl=10.0, clock=lambda: now[0])
+    cache.put(("menu", 1), "a")
+    cache.put(("menu", 2), "b")
+    assert cache.get(("menu", 1)) == "a"          # 1 is now the most recent
+    cache.put(("menu", 3), "c")                   # evicts 2, the least recent
+    assert cache.get(("menu", 2)) is None
+    assert cache.get(("menu", 1)) == "a" and cache.get(("menu", 3)) == "c"
+    cache.invalidate_namespace("menu")
+    assert cache.get(("menu", 1)) is None
+    cache.put(("ingredient", 1), "x")
+    now[0] = 10.0                                 # expires at put time + ttl
+    assert cache.get(("ingredient", 1)) is None
+    assert cache.stats()["size"] == 0
+
+def check_async_surface() -> None:
+    print("AsyncDatabaseAdapter mirrors DatabaseAdapter…")
+    for name, sync_method in inspect.getmembers(DatabaseAdapter, callable):
+        if name.startswith("_") or name in SYNC_ONLY:
+            continue
+        async_method = getattr(AsyncDatabaseAdapter, name, None)
+        assert async_method is not None, f"AsyncDatabaseAdapter.{name} is missing"
+        sync_params = list(inspect.signature(sync_method).parameters)
+        async_params = list(inspect.signature(async_method).parameters)
+        assert sync_params == async_params, f"{name}: {sync_params} != {async_params}"
+
+def check_cursors() -> None:
+    print("Keyset cursors…")
+    from app import APIError, decode_cursor, encode_cursor
+
+    token = encode_cursor("menus", "Pasta Ä")
+    assert "=" not in token
+    assert decode_cursor("menus", token, str) == "Pasta Ä"
+    assert decode_cursor("users", encode_cursor("users", 42), int) == 42
+    for kind, bad, key_type in (("ingredients", token, str), ("menus", "not*base64", str), ("users", token, int)):
+        try:
+            decode_cursor(kind, bad, key_type)
+        except APIError as e:
+            assert e.status == 422 and e.code == "invalid_cursor"
+        else:
+            raise AssertionError(f"cursor {bad!r} accepted for {kind}")
+
+def check_menu_index() -> None:
+    print("MenuIngredientIndex…")
+    index = MenuIngredientIndex([(1, 10, 100.0), (1, 11, 50.0), (2, 11, 20.0)])
+    assert index.ingredient_counts() == {1: 2, 2: 1}
+    assert index.postings(11) == {1: 50.0, 2: 20.0}
+    # 10: fully stocked, 11: 25 of 50 for menu 1 and more than enough for menu 2
+    coverage = index.coverage({10: 100.0, 11: 25.0, 99: 5.0})
+    assert close(coverage[1], 1.5) and close(coverage[2], 1.0)
+    assert close(index.coverage({11: 25.0}, people=2)[2], 25.0 / 40.0)
+    index.set_menu(2, {10: 5.0})
+    assert index.postings(11) == {1: 50.0} and index.postings(10) == {1: 100.0, 2: 5.0}
+    index.remove_menu(1)
+    assert index.ingredients(1) == {} and index.postings(11) == {}
+    assert index.ingredient_counts() == {2: 1}
+
+def _planner_menus() -> List[Menu]:
+    return [
+        {"id": i, "name": f"m{i}", "description": "", "type": "lunch", "cooking_time": 10, "recipe": []}
+        for i in range(1, 31)
+    ]
+
+class _PlannerDB:
+    """Just the adapter reads the planners use."""
+
+    def __init__(self) -> None:
+        # Menu i: i*40 kcal, the rest flat; menus 21-30 have no ingredients
+        self.nutrients = {i: (i * 40.0, 10.0, 50.0, 15.0, 5.0) for i in range(1, 21)}
+        self.index = MenuIngredientIndex([(i, 100 + i, 10.0) for i in range(1, 31)])
+
+    def get_menu_nutrients(self) -> Dict[int, Any]:
+        return self.nutrients
+
+    def menu_ingredient_index(self) -> MenuIngredientIndex:
+        return self.index
+
+def check_planners() -> None:
+    print("Planners…")
+    db: Any = _PlannerDB()
+    menus = _planner_menus()
+    days = [date(2030, 1, 1) + timedelta(days=d) for d in range(3)]
+    slots = [(d, "lunch") for d in days]
+
+    planner = NutritionPlanner(db, time_budget=0.05, seed=1)
+    assert planner.matrix() is planner.matrix()  # cached while the data is
+    started = time.perf_counter()
+    # One lunch per day at 800 kcal: menu 20 fits best, but not three times
+    plan = planner.plan(slots, {"lunch": menus}, targets={"calories": 800.0})
+    assert time.perf_counter() - started < 1.0
+    chosen = [plan[slot]["id"] for slot in slots]
+    assert len(set(chosen)) == 3, chosen
+    assert all(menu_id >= 17 for menu_id in chosen), chosen
+    # An explicit 0 is a target, not a missing one
+    plan = planner.plan(slots, {"lunch": menus}, targets={"calories": 0.0})
+    assert {plan[slot]["id"] for slot in slots} == {1, 2, 3}, plan
+
+    pantry = PantryPlanner(db)
+    plan = pantry.plan(slots[:2], {"lunch": menus}, {105: 10.0, 107: 10.0, 999: 1.0})
+    assert {plan[slot]["id"] for slot in slots[:2]} == {5, 7}
+    # Stock claimed by an existing meal is not counted again
+    existing: Any = [{"date": days[0], "type": "dinner", "menu_id": 5, "people": 1, "ingredients": []}]
+    plan = pantry.plan(slots[:1], {"lunch": menus}, {105: 10.0, 107: 5.0}, existing)
+    assert plan[slots[0]]["id"] == 7
+
+def unit_checks() -> None:
+    check_catalog_cache()
+    check_async_surface()
+    check_cursors()
+    check_menu_index()
+    check_planners()
+    print("Unit checks: OK ✅")
+
 def main() -> None:
+    unit_checks()
+    if "--unit" in sys.argv:
+        return
+
     adapter = DatabaseAdapter(
         host=os.getenv("PGHOST", "127.0.0.1"),
         username=os.getenv("PGUSER", "postgres"),
@@ -130,6 +263,41 @@ def main() -> None:
         ]
         assert adapter.set_meal_ingredients(meal_id, mitems)
 
+        print("Saving a plan the way PUT /users/<id>/meals does…")
+        # Round-trip through JSON: dates arrive as ISO strings
+        plan = json.loads(json.dumps([{
+            "id": 0,
+            "user_id": TEST_USER_ID,
+            "date": (date.today() + timedelta(days=1)).isoformat(),
+            "type": "dinner",
+            "name": "Planned Rice & Beans",
+            "description": "JSON plan smoke test meal",
+            "people": 1,
+            "menu_id": menu_id,
+            "ingredients": None,
+        }]))
+        saved = MealManager(adapter).safe_meals(TEST_USER_ID, plan)
+        assert saved["status"] == "success", saved["error"]
+        planned_id = plan[0]["id"]
+        assert planned_id > 0
+        assert {it["ingredient_id"] for it in adapter.get_meal_ingredients(planned_id)} == {ING1_ID, ING2_ID}
+
+        print("Bulk inventory update…")
+        inv = adapter.update_user_inventory(TEST_USER_ID, [
+            {"ingredient_id": ING1_ID, "delta": -100.0},
+            {"ingredient_id": ING2_ID, "quantity": 250.0},
+            {"ingredient_id": ING2_ID, "delta": 10.0},
+        ])
+        assert close(inv[ING1_ID], 400.0) and close(inv[ING2_ID], 260.0), inv
+        # A delta below zero clamps, and an item at 0 is removed
+        inv = adapter.update_user_inventory(TEST_USER_ID, [{"ingredient_id": ING2_ID, "delta": -1000.0}])
+        assert ING2_ID not in inv and close(inv[ING1_ID], 400.0), inv
+        inv = adapter.update_user_inventory(TEST_USER_ID, [
+            {"ingredient_id": ING1_ID, "quantity": 500.0},
+            {"ingredient_id": ING2_ID, "quantity": 300.0},
+        ])
+        assert inv == adapter.get_user_inventory(TEST_USER_ID) == {ING1_ID: 500.0, ING2_ID: 300.0}
+
         # -------- reads --------
         print("Reading back entities…")
         u = adapter.get_user(TEST_USER_ID)
@@ -144,6 +312,12 @@ def main() -> None:
         m = adapter.get_meal(meal_id)
         assert m is not None and m["people"] == 2
 
+        # Today: 2 people x (120 rice, 80 beans); tomorrow: 1 x the copied menu
+        today, tomorrow = date.today(), date.today() + timedelta(days=1)
+        required = adapter.get_required_ingredients(TEST_USER_ID, today, tomorrow)
+        assert close(required[ING1_ID], 360.0) and close(required[ING2_ID], 240.0), required
+        assert adapter.get_shopping_list(TEST_USER_ID, today, tomorrow) == []
+
         # -------- updates --------
         print("Updating records…")
         assert adapter.update_user(TEST_USER_ID, location="Testville 2")
@@ -152,6 +326,22 @@ def main() -> None:
         m2 = adapter.get_meal(meal_id)
         assert m2 is not None and m2["people"] == 3 and m2["name"] == "Updated Meal"
 
+        print("Shopping list after the meal edit…")
+        required = adapter.get_required_ingredients(TEST_USER_ID, today, tomorrow)
+        assert close(required[ING1_ID], 480.0) and close(required[ING2_ID], 320.0), required
+        shopping = adapter.get_shopping_list(TEST_USER_ID, today, tomorrow)
+        assert [(it["ingredient"]["id"], it["quantity"]) for it in shopping] == [(ING2_ID, 20.0)], shopping
+
+        print("Cooking a meal…")
+        cooked = adapter.cook_meal(meal_id)
+        assert cooked["cooked"] == [meal_id]
+        # 3 people x 120 rice, 3 x 80 beans
+        assert close(cooked["inventory"][ING1_ID], 140.0) and close(cooked["inventory"][ING2_ID], 60.0), cooked
+        assert adapter.cook_meal(meal_id)["cooked"] == []  # never deducted twice
+        assert adapter.get_user_inventory(TEST_USER_ID) == {ING1_ID: 140.0, ING2_ID: 60.0}
+        required = adapter.get_required_ingredients(TEST_USER_ID, today, tomorrow)
+        assert close(required[ING1_ID], 120.0) and close(required[ING2_ID], 80.0), required
+
         ing1_reload = adapter.get_ingredient(ING1_ID)
         assert ing1_reload is not None and abs(ing1_reload["calories"] - 3.7) < 1e-6
 
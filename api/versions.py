@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import hashlib
+import os
+import select
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from database_adapter import DatabaseAdapter
+
+
+CHANNEL = "sagdu_data_version"
+
+
+class DataVersions:
+    """
+    Change counters for the API's ETags, one per scope ("ingredients",
+    "menus", "user:<id>"). Write endpoints `bump` the scopes they touch;
+    the counters live in app.data_version and every bump is broadcast with
+    NOTIFY, so each process keeps an in-memory copy and can answer
+    If-None-Match without a query.
+
+    While the listener is not connected (DB down, right after start) the
+    copy may be stale, so `etag` returns None and responses go out
+    unconditionally. Data written around the API (psql, seed scripts)
+    does not bump anything.
+
+    `on_change(scope)` runs for every scope another process moved forward,
+    before the new version is visible, so per-process caches behind the
+    ETagged responses can be dropped and never pair stale bodies with a
+    new tag.
+    """
+
+    def __init__(
+        self,
+        db: DatabaseAdapter,
+        channel: str = CHANNEL,
+        on_change: Optional[Callable[[str], None]] = None,
+    ) -> None:
+        self.db = db
+        self.channel = channel
+        self.on_change = on_change
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._ready = False
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    def bump(self, *scopes: str) -> None:
+        self._apply(self.db.bump_versions(scopes, self.channel))
+
+    def etag(self, *scopes: str, extra: Iterable[Any] = ()) -> Optional[str]:
+        """Strong ETag for the current versions of `scopes` plus `extra` (query args etc.)."""
+        self._ensure_listener()
+        if not self._ready:
+            return None
+        with self._lock:
+            parts = [f"{scope}:{self._versions.get(scope, 0)}" for scope in scopes]
+        parts.extend(str(x) for x in extra)
+        return hashlib.sha1("|".join(parts).encode()).hexdigest()[:20]
+
+    def _apply(self, versions: Dict[str, int]) -> None:
+        with self._lock:
+            for scope, version in versions.items():
+                # Notifications of concurrent bumps may arrive out of order
+                if version > self._versions.get(scope, 0):
+                    self._versions[scope] = version
+
+    def _apply_remote(self, versions: Dict[str, int]) -> None:
+        if self.on_change is not None:
+            with self._lock:
+                changed = [s for s, v in versions.items() if v > self._versions.get(s, 0)]
+            for scope in changed:
+                self.on_change(scope)
+        self._apply(versions)
+
+    def _ensure_listener(self) -> None:
+        # Checked per call because gunicorn may fork after the app was created
+        pid = os.getpid()
+        if self._pid == pid and self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._pid == pid and self._thread is not None and self._thread.is_alive():
+                return
+            self._pid = pid
+            self._ready = False
+            self._thread = threading.Thread(target=self._listen, name="data-versions", daemon=True)
+            self._thread.start()
+
+    def _listen(self) -> None:
+        while True:
+            conn = None
+            try:
+                conn = self.db.listen(self.channel)
+                # Load after LISTEN so no bump falls in between
+                self._apply_remote(self.db.data_versions())
+                self._ready = True
+                while True:
+                    if select.select([conn], [], [], 30.0) == ([], [], []):
+                        # Idle: make sure the connection is still alive
+                        with conn.cursor() as cur:
+                            cur.execute("SELECT 1")
+                    conn.poll()
+                    while conn.notifies:
+                        scope, _, version = conn.notifies.pop(0).payload.rpartition(":")
+                        self._apply_remote({scope: int(version)})
+            except Exception as e:
+                print(f"Data version listener error: {e}")
+            finally:
+                self._ready = False
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+            time.sleep(5.0)
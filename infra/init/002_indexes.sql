@@ -0,0 +1,58 @@
+-- Migration 2: indexes for the meal date-range hot path
+-- Idempotent, can be re-run against an existing database:
+--   psql -d sagdu -f infra/init/002_indexes.sql
+CREATE SCHEMA IF NOT EXISTS app AUTHORIZATION postgres;
+SET search_path TO app, public;
+
+CREATE TABLE IF NOT EXISTS schema_migration (
+  version    INTEGER PRIMARY KEY,
+  name       TEXT NOT NULL,
+  applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+
+-- Earlier versions of this file copied the meal's TEXT columns into
+-- meal_user_date_idx (a long description then failed to insert) and added a
+-- meal_ingredient index duplicating its primary key. Drop those on re-run.
+DO $$
+BEGIN
+  IF EXISTS (
+    SELECT 1
+    FROM pg_index AS x
+    JOIN pg_class AS c ON c.oid = x.indexrelid
+    JOIN pg_namespace AS n ON n.oid = c.relnamespace
+    WHERE n.nspname = 'app' AND c.relname = 'meal_user_date_idx' AND x.indnatts <> 3
+  ) THEN
+    DROP INDEX app.meal_user_date_idx;
+  END IF;
+END;
+$$;
+DROP INDEX IF EXISTS meal_ingredient_meal_covering_idx;
+
+-- list_meals_by_user: WHERE user_id = ? AND date BETWEEN ? AND ? ORDER BY date, id.
+-- No INCLUDE columns: the meal rows are read from the heap anyway, and TEXT
+-- columns would bound their length by the index tuple size.
+CREATE INDEX IF NOT EXISTS meal_user_date_idx
+  ON meal (user_id, date, id);
+
+-- ON DELETE SET NULL from menu would otherwise scan all meals
+CREATE INDEX IF NOT EXISTS meal_menu_id_idx
+  ON meal (menu_id);
+
+-- Reverse lookups and the ON DELETE RESTRICT checks from ingredient
+CREATE INDEX IF NOT EXISTS meal_ingredient_ingredient_id_idx
+  ON meal_ingredient (ingredient_id);
+CREATE INDEX IF NOT EXISTS menu_ingredient_ingredient_id_idx
+  ON menu_ingredient (ingredient_id);
+
+-- Menu lookups by meal type: type @> ARRAY['lunch']
+CREATE INDEX IF NOT EXISTS menu_type_gin_idx
+  ON menu USING GIN (type);
+
+INSERT INTO schema_migration (version, name)
+VALUES (2, 'meal date-range indexes')
+ON CONFLICT (version) DO NOTHING;
+
+ANALYZE meal;
+ANALYZE meal_ingredient;
+ANALYZE menu_ingredient;
+ANALYZE menu;
@@ -0,0 +1,17 @@
+-- Migration 3: change counters behind the API's ETags
+-- Idempotent, can be re-run against an existing database:
+--   psql -d sagdu -f infra/init/003_data_version.sql
+CREATE SCHEMA IF NOT EXISTS app AUTHORIZATION postgres;
+SET search_path TO app, public;
+
+-- One row per scope ('ingredients', 'menus', 'user:<id>'), bumped by the API's
+-- write endpoints and broadcast with NOTIFY so every API process can answer
+-- If-None-Match from memory. A missing row means version 0.
+CREATE TABLE IF NOT EXISTS data_version (
+  scope   TEXT PRIMARY KEY,
+  version BIGINT NOT NULL
+);
+
+INSERT INTO schema_migration (version, name)
+VALUES (3, 'data version counters')
+ON CONFLICT (version) DO NOTHING;
@@ -0,0 +1,100 @@
+-- Migration 4: precomputed dietary flags per menu
+-- Idempotent, can be re-run against an existing database:
+--   psql -d sagdu -f infra/init/004_menu_diet_flags.sql
+CREATE SCHEMA IF NOT EXISTS app AUTHORIZATION postgres;
+SET search_path TO app, public;
+
+-- Bit set = every ingredient of the menu has the flag. Must match DIET_FLAGS
+-- in api/database_adapter.py:
+--   1 vegetarian, 2 vegan, 4 gluten_free, 8 lactose_free, 16 soy_free
+-- A menu without ingredients has no bits, i.e. it is only offered to users
+-- without dietary restrictions.
+ALTER TABLE menu ADD COLUMN IF NOT EXISTS diet_flags SMALLINT NOT NULL DEFAULT 0;
+
+CREATE OR REPLACE FUNCTION refresh_menu_diet_flags(menu_ids BIGINT[]) RETURNS void
+LANGUAGE sql AS $$
+  UPDATE app.menu AS m
+  SET diet_flags = f.flags
+  FROM (
+    SELECT mm.id,
+           COALESCE(
+             (CASE WHEN bool_and(i.vegetarian)   THEN 1  ELSE 0 END)
+           | (CASE WHEN bool_and(i.vegan)        THEN 2  ELSE 0 END)
+           | (CASE WHEN bool_and(i.gluten_free)  THEN 4  ELSE 0 END)
+           | (CASE WHEN bool_and(i.lactose_free) THEN 8  ELSE 0 END)
+           | (CASE WHEN bool_and(i.soy_free)     THEN 16 ELSE 0 END),
+             0
+           )::smallint AS flags
+    FROM app.menu AS mm
+    LEFT JOIN app.menu_ingredient AS mi ON mi.menu_id = mm.id
+    LEFT JOIN app.ingredient AS i ON i.id = mi.ingredient_id
+    WHERE mm.id = ANY(menu_ids)
+    GROUP BY mm.id
+  ) AS f
+  WHERE m.id = f.id
+    AND m.diet_flags IS DISTINCT FROM f.flags;
+$$;
+
+-- Statement-level, so replacing a whole ingredient list refreshes each menu once
+CREATE OR REPLACE FUNCTION menu_ingredient_refresh_diet_flags() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    PERFORM app.refresh_menu_diet_flags(ARRAY(SELECT DISTINCT menu_id FROM new_rows));
+  ELSIF TG_OP = 'DELETE' THEN
+    PERFORM app.refresh_menu_diet_flags(ARRAY(SELECT DISTINCT menu_id FROM old_rows));
+  ELSE
+    PERFORM app.refresh_menu_diet_flags(ARRAY(
+      SELECT menu_id FROM new_rows UNION SELECT menu_id FROM old_rows
+    ));
+  END IF;
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS menu_ingredient_diet_flags_ins ON menu_ingredient;
+CREATE TRIGGER menu_ingredient_diet_flags_ins
+  AFTER INSERT ON menu_ingredient
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION menu_ingredient_refresh_diet_flags();
+
+DROP TRIGGER IF EXISTS menu_ingredient_diet_flags_upd ON menu_ingredient;
+CREATE TRIGGER menu_ingredient_diet_flags_upd
+  AFTER UPDATE ON menu_ingredient
+  REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION menu_ingredient_refresh_diet_flags();
+
+DROP TRIGGER IF EXISTS menu_ingredient_diet_flags_del ON menu_ingredient;
+CREATE TRIGGER menu_ingredient_diet_flags_del
+  AFTER DELETE ON menu_ingredient
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION menu_ingredient_refresh_diet_flags();
+
+-- Flag changes on an ingredient propagate to every menu that uses it
+CREATE OR REPLACE FUNCTION ingredient_refresh_diet_flags() RETURNS trigger
+LANGUAGE plpgsql AS $$
+BEGIN
+  PERFORM app.refresh_menu_diet_flags(ARRAY(
+    SELECT DISTINCT menu_id FROM app.menu_ingredient WHERE ingredient_id = NEW.id
+  ));
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS ingredient_diet_flags ON ingredient;
+CREATE TRIGGER ingredient_diet_flags
+  AFTER UPDATE OF vegetarian, vegan, gluten_free, lactose_free, soy_free ON ingredient
+  FOR EACH ROW
+  WHEN (
+    (OLD.vegetarian, OLD.vegan, OLD.gluten_free, OLD.lactose_free, OLD.soy_free)
+    IS DISTINCT FROM
+    (NEW.vegetarian, NEW.vegan, NEW.gluten_free, NEW.lactose_free, NEW.soy_free)
+  )
+  EXECUTE FUNCTION ingredient_refresh_diet_flags();
+
+-- Backfill existing menus
+SELECT refresh_menu_diet_flags(ARRAY(SELECT id FROM menu));
+
+INSERT INTO schema_migration (version, name)
+VALUES (4, 'menu dietary flags')
+ON CONFLICT (version) DO NOTHING;
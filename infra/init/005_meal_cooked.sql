@@ -0,0 +1,14 @@
+-- Migration 5: cooked meals
+-- Idempotent, can be re-run against an existing database:
+--   psql -d sagdu -f infra/init/005_meal_cooked.sql
+CREATE SCHEMA IF NOT EXISTS app AUTHORIZATION postgres;
+SET search_path TO app, public;
+
+-- Set when the meal's ingredients were deducted from the user's inventory
+-- (DatabaseAdapter.cook_meal/cook_meals). Cooked meals no longer count
+-- towards the shopping list, and a meal is only ever deducted once.
+ALTER TABLE meal ADD COLUMN IF NOT EXISTS cooked_at TIMESTAMPTZ;
+
+INSERT INTO schema_migration (version, name)
+VALUES (5, 'cooked meals')
+ON CONFLICT (version) DO NOTHING;
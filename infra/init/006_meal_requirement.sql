@@ -0,0 +1,171 @@
+-- Migration 6: maintained per-user, per-day ingredient requirements
+-- Idempotent, can be re-run against an existing database:
+--   psql -d sagdu -f infra/init/006_meal_requirement.sql
+CREATE SCHEMA IF NOT EXISTS app AUTHORIZATION postgres;
+SET search_path TO app, public;
+
+-- Sum of meal_ingredient.quantity * meal.people over the user's uncooked
+-- meals of the day, per ingredient. Read by the shopping list and
+-- get_required_ingredients instead of aggregating every meal per request.
+-- Maintained by the triggers below; no foreign keys, because rows of a
+-- deleted user or meal are removed by the same triggers.
+CREATE TABLE IF NOT EXISTS meal_requirement (
+  user_id       BIGINT NOT NULL,
+  date          DATE NOT NULL,
+  ingredient_id BIGINT NOT NULL,
+  quantity      NUMERIC NOT NULL,
+  PRIMARY KEY (user_id, date, ingredient_id) INCLUDE (quantity)
+);
+
+-- Recompute the (user, day) buckets touched by a statement from the current
+-- meals. A bucket holds a few meals, so a write costs a few rows no matter
+-- how many meals are planned. Recomputing (rather than adding deltas) also
+-- copes with cascaded deletes, where the meal row is already gone when its
+-- meal_ingredient rows are removed.
+CREATE OR REPLACE FUNCTION refresh_meal_requirements(user_ids BIGINT[], dates DATE[]) RETURNS void
+LANGUAGE plpgsql AS $$
+BEGIN
+  -- Serialize per user: otherwise two transactions adding meals to the same
+  -- day would each write a total that misses the other's meal. The next
+  -- statement takes a fresh snapshot, so it sees what the lock waited for.
+  PERFORM pg_advisory_xact_lock(hashtextextended('meal_requirement:' || u.user_id, 0))
+  FROM (SELECT DISTINCT user_id FROM unnest(user_ids) AS t(user_id) ORDER BY user_id) AS u;
+
+  WITH buckets AS (
+    SELECT DISTINCT user_id, date
+    FROM unnest(user_ids, dates) AS t(user_id, date)
+  ),
+  fresh AS (
+    SELECT m.user_id, m.date, mi.ingredient_id, SUM(mi.quantity * m.people) AS quantity
+    FROM buckets AS b
+    JOIN app.meal AS m
+      ON m.user_id = b.user_id AND m.date = b.date AND m.cooked_at IS NULL
+    JOIN app.meal_ingredient AS mi
+      ON mi.meal_id = m.id
+    GROUP BY m.user_id, m.date, mi.ingredient_id
+  ),
+  removed AS (
+    DELETE FROM app.meal_requirement AS r
+    USING buckets AS b
+    WHERE r.user_id = b.user_id
+      AND r.date = b.date
+      AND NOT EXISTS (
+        SELECT 1 FROM fresh AS f
+        WHERE f.user_id = r.user_id AND f.date = r.date AND f.ingredient_id = r.ingredient_id
+      )
+  )
+  INSERT INTO app.meal_requirement AS r (user_id, date, ingredient_id, quantity)
+  SELECT user_id, date, ingredient_id, quantity FROM fresh
+  ON CONFLICT (user_id, date, ingredient_id)
+  DO UPDATE SET quantity = EXCLUDED.quantity
+  WHERE r.quantity IS DISTINCT FROM EXCLUDED.quantity;
+END;
+$$;
+
+-- Meals: old and new buckets of inserted, moved, resized, cooked or deleted
+-- meals. Both arrays come from one ordered aggregate, so they pair up.
+CREATE OR REPLACE FUNCTION meal_refresh_requirements() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+  user_ids BIGINT[];
+  dates    DATE[];
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    SELECT array_agg(user_id ORDER BY user_id, date), array_agg(date ORDER BY user_id, date)
+    INTO user_ids, dates
+    FROM (SELECT DISTINCT user_id, date FROM new_rows) AS b;
+  ELSIF TG_OP = 'DELETE' THEN
+    SELECT array_agg(user_id ORDER BY user_id, date), array_agg(date ORDER BY user_id, date)
+    INTO user_ids, dates
+    FROM (SELECT DISTINCT user_id, date FROM old_rows) AS b;
+  ELSE
+    SELECT array_agg(user_id ORDER BY user_id, date), array_agg(date ORDER BY user_id, date)
+    INTO user_ids, dates
+    FROM (
+      SELECT user_id, date FROM new_rows
+      UNION
+      SELECT user_id, date FROM old_rows
+    ) AS b;
+  END IF;
+  PERFORM app.refresh_meal_requirements(user_ids, dates);
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS meal_requirement_ins ON meal;
+CREATE TRIGGER meal_requirement_ins
+  AFTER INSERT ON meal
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION meal_refresh_requirements();
+
+-- Statement-level UPDATE OF triggers cannot have transition tables, so
+-- every meal update refreshes; name/description edits cost one bucket.
+DROP TRIGGER IF EXISTS meal_requirement_upd ON meal;
+CREATE TRIGGER meal_requirement_upd
+  AFTER UPDATE ON meal
+  REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION meal_refresh_requirements();
+
+DROP TRIGGER IF EXISTS meal_requirement_del ON meal;
+CREATE TRIGGER meal_requirement_del
+  AFTER DELETE ON meal
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION meal_refresh_requirements();
+
+-- Meal ingredients: the buckets of the meals whose rows changed. Rows
+-- removed by a cascade from meal have no meal left; the meal trigger
+-- covers those.
+CREATE OR REPLACE FUNCTION meal_ingredient_refresh_requirements() RETURNS trigger
+LANGUAGE plpgsql AS $$
+DECLARE
+  meal_ids BIGINT[];
+  user_ids BIGINT[];
+  dates    DATE[];
+BEGIN
+  IF TG_OP = 'INSERT' THEN
+    meal_ids := ARRAY(SELECT DISTINCT meal_id FROM new_rows);
+  ELSIF TG_OP = 'DELETE' THEN
+    meal_ids := ARRAY(SELECT DISTINCT meal_id FROM old_rows);
+  ELSE
+    meal_ids := ARRAY(SELECT meal_id FROM new_rows UNION SELECT meal_id FROM old_rows);
+  END IF;
+  SELECT array_agg(user_id ORDER BY id), array_agg(date ORDER BY id)
+  INTO user_ids, dates
+  FROM app.meal
+  WHERE id = ANY(meal_ids);
+  PERFORM app.refresh_meal_requirements(user_ids, dates);
+  RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS meal_ingredient_requirement_ins ON meal_ingredient;
+CREATE TRIGGER meal_ingredient_requirement_ins
+  AFTER INSERT ON meal_ingredient
+  REFERENCING NEW TABLE AS new_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION meal_ingredient_refresh_requirements();
+
+DROP TRIGGER IF EXISTS meal_ingredient_requirement_upd ON meal_ingredient;
+CREATE TRIGGER meal_ingredient_requirement_upd
+  AFTER UPDATE ON meal_ingredient
+  REFERENCING NEW TABLE AS new_rows OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION meal_ingredient_refresh_requirements();
+
+DROP TRIGGER IF EXISTS meal_ingredient_requirement_del ON meal_ingredient;
+CREATE TRIGGER meal_ingredient_requirement_del
+  AFTER DELETE ON meal_ingredient
+  REFERENCING OLD TABLE AS old_rows
+  FOR EACH STATEMENT EXECUTE FUNCTION meal_ingredient_refresh_requirements();
+
+-- Backfill
+DELETE FROM meal_requirement;
+INSERT INTO meal_requirement (user_id, date, ingredient_id, quantity)
+SELECT m.user_id, m.date, mi.ingredient_id, SUM(mi.quantity * m.people)
+FROM meal AS m
+JOIN meal_ingredient AS mi
+  ON mi.meal_id = m.id
+WHERE m.cooked_at IS NULL
+GROUP BY m.user_id, m.date, mi.ingredient_id;
+
+INSERT INTO schema_migration (version, name)
+VALUES (6, 'maintained meal requirements')
+ON CONFLICT (version) DO NOTHING;